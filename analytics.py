@@ -0,0 +1,268 @@
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import numpy as np
+import mysql.connector as sql
+import project_CS as app
+
+# Columnar copy of the sales history for reporting away from the tills. Every
+# billitems row becomes one entry in each column file; columns are appended
+# by bill_no high-water mark and read back as memory-mapped NumPy arrays.
+ANALYTICS_DIR = os.getenv('ANALYTICS_DIR', 'analytics')
+FETCH_BATCH = 50_000
+# bill_nos below the high-water mark that had no billitems yet are rechecked on
+# later refreshes (a bill can commit after a higher-numbered one); gaps further
+# back than this are rolled-back bills and are forgotten.
+GAP_WINDOW = 5_000
+COLUMNS = {
+    'bill_no': np.int32,
+    'bill_date': np.int32,   # days since 1970-01-01
+    'cust_id': np.int32,     # -1 when the bill has no customer
+    'p_id': np.int32,
+    'quantity': np.int32,
+    'sales_cents': np.int64,  # quantity * unit_price, before GST
+}
+GROUP_BY = ('date', 'product', 'brand', 'supplier', 'customer')
+EPOCH = datetime.date(1970, 1, 1)
+
+def column_path(directory, name):
+    return os.path.join(directory, f'{name}.bin')
+
+def read_meta(directory):
+    path = os.path.join(directory, 'meta.json')
+    if not os.path.exists(path):
+        return {'rows': 0, 'high_water': 0, 'gaps': [], 'refreshed': None}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def write_meta(directory, meta):
+    tmp_path = os.path.join(directory, 'meta.json.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, os.path.join(directory, 'meta.json'))
+
+def trim_columns(directory, rows):
+    """Cut every column back to `rows` entries, dropping a half-written append."""
+    for name, dtype in COLUMNS.items():
+        path = column_path(directory, name)
+        with open(path, 'ab') as f:
+            f.truncate(rows * np.dtype(dtype).itemsize)
+
+def export_products(cursor, directory):
+    """Products are small and mutable (profit, brand, supplier), so they are rewritten in full."""
+    cursor.execute("""
+        SELECT s.p_id, s.name, s.brand, s.supplier, COALESCE(p.profit, 0)
+        FROM stock s
+        LEFT JOIN profits p ON p.p_id = s.p_id
+        ORDER BY s.p_id
+    """)
+    products = [list(row) for row in cursor.fetchall()]
+    tmp_path = os.path.join(directory, 'products.json.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(products, f)
+    os.replace(tmp_path, os.path.join(directory, 'products.json'))
+    return len(products)
+
+def append_batch(directory, rows):
+    columns = {name: [] for name in COLUMNS}
+    for bill_no, bill_date, cust_id, p_id, quantity, unit_price in rows:
+        columns['bill_no'].append(bill_no)
+        columns['bill_date'].append((bill_date - EPOCH).days if bill_date else 0)
+        columns['cust_id'].append(cust_id if cust_id is not None else -1)
+        columns['p_id'].append(p_id)
+        columns['quantity'].append(quantity)
+        columns['sales_cents'].append(int(round(unit_price * 100)) * quantity)
+    for name, dtype in COLUMNS.items():
+        with open(column_path(directory, name), 'ab') as f:
+            f.write(np.asarray(columns[name], dtype=dtype).tobytes())
+    return set(columns['bill_no'])
+
+def refresh(cursor, directory=ANALYTICS_DIR, full=False):
+    """Append billitems of bills newer than the high-water mark (plus recent gaps); returns rows added."""
+    os.makedirs(directory, exist_ok=True)
+    meta = read_meta(directory)
+    if full:
+        meta = {'rows': 0, 'high_water': 0, 'gaps': [], 'refreshed': None}
+    trim_columns(directory, meta['rows'])
+    started = time.monotonic()
+    cursor.execute("""
+        SELECT GREATEST((SELECT COALESCE(MAX(bill_no), 0) FROM bills),
+                        (SELECT COALESCE(MAX(bill_no), 0) FROM bills_archive))
+    """)
+    high_water = cursor.fetchone()[0]
+    where = "bi.bill_no > %s AND bi.bill_no <= %s"
+    params = [meta['high_water'], high_water]
+    if meta['gaps']:
+        where = f"({where} OR bi.bill_no IN ({', '.join(['%s'] * len(meta['gaps']))}))"
+        params += meta['gaps']
+    # a --full rebuild reaches back into bills the archive job has moved
+    lines = app.hot_and_cold(f"""
+        SELECT bi.bill_no, b.bill_date, b.cust_id, bi.p_id, bi.quantity, bi.unit_price
+        FROM {{billitems}} bi
+        INNER JOIN {{bills}} b ON b.bill_no = bi.bill_no
+        WHERE {where}
+    """)
+    cursor.execute(f"{lines}\n    ORDER BY bill_no", tuple(params) * 2)
+    added = 0
+    seen = set()
+    while True:
+        rows = cursor.fetchmany(FETCH_BATCH)
+        if not rows:
+            break
+        seen |= append_batch(directory, rows)
+        added += len(rows)
+    candidates = set(meta['gaps']) | set(range(max(meta['high_water'], high_water - GAP_WINDOW) + 1, high_water + 1))
+    products = export_products(cursor, directory)
+    meta.update({
+        'rows': meta['rows'] + added,
+        'high_water': high_water,
+        'gaps': sorted(b for b in candidates - seen if b > high_water - GAP_WINDOW),
+        'refreshed': datetime.datetime.now().isoformat(timespec='seconds'),
+        'products': products,
+        'seconds': round(time.monotonic() - started, 3),
+    })
+    write_meta(directory, meta)
+    return added
+
+def load_snapshot(directory=ANALYTICS_DIR):
+    """Memory-map the columns and load the product dimension."""
+    meta = read_meta(directory)
+    columns = {}
+    for name, dtype in COLUMNS.items():
+        if meta['rows']:
+            columns[name] = np.memmap(column_path(directory, name), dtype=dtype, mode='r', shape=(meta['rows'],))
+        else:
+            columns[name] = np.zeros(0, dtype=dtype)
+    with open(os.path.join(directory, 'products.json'), encoding='utf-8') as f:
+        products = json.load(f)
+    # slot 0 stands in for products deleted from stock since they were sold
+    p_ids = np.array([row[0] for row in products], dtype=np.int32)
+    brands = sorted({row[2] or '' for row in products})
+    suppliers = sorted({row[3] or '' for row in products})
+    brand_code = {brand: i for i, brand in enumerate(brands)}
+    supplier_code = {supplier: i for i, supplier in enumerate(suppliers)}
+    dims = {
+        'p_ids': p_ids,
+        'names': ['(deleted product)'] + [row[1] for row in products],
+        'brands': brands + ['(unknown)'],
+        'suppliers': suppliers + ['(unknown)'],
+        'brand': np.array([len(brands)] + [brand_code[row[2] or ''] for row in products], dtype=np.int32),
+        'supplier': np.array([len(suppliers)] + [supplier_code[row[3] or ''] for row in products], dtype=np.int32),
+        'profit_cents': np.array([0] + [int(row[4]) * 100 for row in products], dtype=np.int64),
+    }
+    return meta, columns, dims
+
+def product_slots(dims, p_id):
+    """Map p_id values to rows of the product dimension (0 for unknown products)."""
+    p_ids = dims['p_ids']
+    if not len(p_ids):
+        return np.zeros(len(p_id), dtype=np.intp)
+    pos = np.minimum(np.searchsorted(p_ids, p_id), len(p_ids) - 1)
+    return np.where(p_ids[pos] == p_id, pos + 1, 0)
+
+def sales_report(columns, dims, by='date', start=None, end=None, top=None):
+    """
+    Group sales between start and end (inclusive dates) by date, product,
+    brand, supplier or customer. Returns rows of
+    (label, bills, quantity, sales, profit), largest sales first except for dates.
+    """
+    if by not in GROUP_BY:
+        raise ValueError(f"by must be one of {', '.join(GROUP_BY)}")
+    mask = np.ones(len(columns['bill_no']), dtype=bool)
+    if start:
+        mask &= columns['bill_date'] >= (start - EPOCH).days
+    if end:
+        mask &= columns['bill_date'] <= (end - EPOCH).days
+    bill_no = columns['bill_no'][mask]
+    quantity = columns['quantity'][mask].astype(np.int64)
+    sales = columns['sales_cents'][mask]
+    slots = product_slots(dims, columns['p_id'][mask])
+    profit = quantity * dims['profit_cents'][slots]
+    keys = {
+        'date': lambda: columns['bill_date'][mask],
+        'product': lambda: columns['p_id'][mask],
+        'brand': lambda: dims['brand'][slots],
+        'supplier': lambda: dims['supplier'][slots],
+        'customer': lambda: columns['cust_id'][mask],
+    }[by]()
+    groups, inverse = np.unique(keys, return_inverse=True)
+    inverse = inverse.ravel()
+    size = len(groups)
+    totals_qty = np.bincount(inverse, weights=quantity, minlength=size)
+    totals_sales = np.bincount(inverse, weights=sales, minlength=size)
+    totals_profit = np.bincount(inverse, weights=profit, minlength=size)
+    # distinct bills per group: unique (group, bill_no) pairs
+    pairs = np.unique(inverse.astype(np.int64) << 32 | bill_no.astype(np.int64))
+    totals_bills = np.bincount((pairs >> 32).astype(np.int64), minlength=size)
+    order = np.arange(size) if by == 'date' else np.argsort(-totals_sales, kind='stable')
+    if top:
+        order = order[:top]
+    rows = []
+    for i in order:
+        key = groups[i]
+        if by == 'date':
+            label = str(EPOCH + datetime.timedelta(days=int(key)))
+        elif by == 'product':
+            label = f"{key} {dims['names'][product_slots(dims, np.array([key]))[0]]}"
+        elif by == 'brand':
+            label = dims['brands'][key]
+        elif by == 'supplier':
+            label = dims['suppliers'][key]
+        else:
+            label = str(key) if key >= 0 else '(walk-in)'
+        rows.append((label, int(totals_bills[i]), int(totals_qty[i]),
+                     float(totals_sales[i]) / 100, float(totals_profit[i]) / 100))
+    return rows
+
+def parse_date(text):
+    return datetime.date.fromisoformat(text)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Columnar sales snapshot and reports that stay off the live tables.')
+    parser.add_argument('--dir', default=ANALYTICS_DIR, help=f'snapshot directory (default: {ANALYTICS_DIR})')
+    parser.add_argument('--store', type=int,
+                        help='snapshot this store from the shard map, kept in <dir>/store<N> (default: STORE_ID)')
+    sub = parser.add_subparsers(dest='command', required=True)
+    refresh_parser = sub.add_parser('refresh', help='append bills newer than the last refresh')
+    refresh_parser.add_argument('--full', action='store_true', help='rebuild the snapshot from scratch')
+    report_parser = sub.add_parser('report', help='sales report from the snapshot')
+    report_parser.add_argument('--by', choices=GROUP_BY, default='date')
+    report_parser.add_argument('--from', dest='start', type=parse_date, help='first date (YYYY-MM-DD)')
+    report_parser.add_argument('--to', dest='end', type=parse_date, help='last date (YYYY-MM-DD)')
+    report_parser.add_argument('--top', type=int, help='only the N largest groups')
+    args = parser.parse_args(argv)
+    if args.store is not None:
+        args.dir = os.path.join(args.dir, f'store{args.store}')
+
+    if args.command == 'refresh':
+        try:
+            with app.checkout('analytics_refresh', shard=args.store) as (db_connection, cursor):
+                added = refresh(cursor, args.dir, args.full)
+                db_connection.rollback()  # end the read snapshot
+        except (sql.Error, ValueError) as e:
+            print(f"Error refreshing analytics snapshot: {e}")
+            sys.exit(1)
+        meta = read_meta(args.dir)
+        print(f"Added {added} billitems ({meta['rows']} total, up to bill {meta['high_water']}) "
+              f"in {meta['seconds']}s")
+        return
+
+    if not os.path.exists(os.path.join(args.dir, 'products.json')):
+        print(f"No snapshot in {args.dir}/ yet: run 'python analytics.py refresh' first.")
+        sys.exit(1)
+    started = time.perf_counter()
+    meta, columns, dims = load_snapshot(args.dir)
+    rows = sales_report(columns, dims, args.by, args.start, args.end, args.top)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(f"Sales by {args.by} (snapshot of {meta['refreshed']}, up to bill {meta['high_water']})")
+    print(f"{args.by.capitalize():<40} {'Bills':>8} {'Qty':>10} {'Sales':>14} {'Profit':>14}")
+    print("=" * 90)
+    for label, bills, quantity, sales, profit in rows:
+        print(f"{label[:40]:<40} {bills:>8} {quantity:>10} {sales:>14.2f} {profit:>14.2f}")
+    print(f"{len(rows)} rows in {elapsed_ms:.1f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,314 @@
 import os
+import sys
+import json
+import gzip
+import time
+import queue
+import argparse
 import datetime
-import subprocess
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+import mysql.connector as sql
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BACKUP_DIR = 'backups'
+INSERT_ROWS = 1000  # rows per extended INSERT, like mysqldump's --extended-insert
+# Append-only tables that incremental backups export by high-water mark
+# (table -> key column, which is also the name of its mark). cust_info also
+# re-exports every customer the new bills reference, since store databases
+# copy customers in with their old home cust_id. Every other table is small
+# or updated in place (stock, summaries, users, sessions) and is copied whole.
+INCREMENTAL_KEYS = {
+    'cust_info': 'cust_id',
+    'bills': 'bill_no',
+    'billitems': 'bill_no',
+    'journal_applied': 'bill_no',
+}
+MARK_TABLES = {'cust_id': 'cust_info', 'bill_no': 'bills'}
+# A number below the mark can still commit later (it was taken before a
+# higher one that committed first), so numbers missing from the last
+# GAP_WINDOW are carried in the manifest and exported once they show up;
+# older ones are rolled back. Same rule as analytics.py.
+GAP_WINDOW = 5_000
+# Archived bills keep their old bill_no, so these follow the archive's own
+# marks: bills dated from the last backup's newest archived date, or numbered
+# above its highest archived bill (replayed offline bills). The overlap is
+# re-exported and upserted.
+ARCHIVE_TABLES = ('bills_archive', 'billitems_archive')
+
+def db_settings():
+    return {
+        'host': os.getenv('DB_HOST', 'localhost'),
+        'user': os.getenv('DB_USER', 'root'),
+        'password': os.getenv('DB_PASSWORD', ''),
+        'database': os.getenv('DB_NAME', 'project_cs'),
+    }
+
+def read_marks(session):
+    """Table list plus the high-water marks, as seen by the session's snapshot."""
+    cur = session.cursor()
+    cur.execute("SHOW TABLES")
+    tables = [row[0] for row in cur.fetchall()]
+    marks = {}
+    for mark, table in MARK_TABLES.items():
+        cur.execute(f"SELECT COALESCE(MAX({mark}), 0) FROM {table}")
+        marks[mark] = cur.fetchone()[0]
+    if ARCHIVE_TABLES[0] in tables:
+        cur.execute(f"SELECT MAX(bill_date), MAX(bill_no) FROM {ARCHIVE_TABLES[0]}")
+        archived_date, archived_bill_no = cur.fetchone()
+        marks['archived_date'] = archived_date.isoformat() if archived_date else None
+        marks['archived_bill_no'] = archived_bill_no
+    cur.close()
+    return tables, marks
+
+def missing_keys(session, table, column, low, high, carried=()):
+    """
+    Keys in (low, high] within GAP_WINDOW of high, plus those carried from the
+    last backup, that the snapshot doesn't have: numbers taken by transactions
+    that hadn't committed yet (or never will).
+    """
+    cur = session.cursor()
+    cur.execute(f"SELECT COALESCE(MIN({column}), 0) FROM {table}")
+    floor = max(low, high - GAP_WINDOW, cur.fetchone()[0] - 1)  # stores number from their own range
+    cur.execute(f"SELECT {column} FROM {table} WHERE {column} > %s AND {column} <= %s", (floor, high))
+    present = {row[0] for row in cur.fetchall()}
+    carried = [key for key in carried if key > high - GAP_WINDOW]
+    if carried:
+        cur.execute(f"SELECT {column} FROM {table} WHERE {column} IN ({', '.join(['%s'] * len(carried))})",
+                    tuple(carried))
+        present.update(row[0] for row in cur.fetchall())
+    cur.close()
+    return sorted((set(range(floor + 1, high + 1)) | set(carried)) - present)
+
+def incremental_where(column, previous, marks):
+    """Rows numbered since the previous backup, plus the ones it found missing."""
+    where = f"{column} > {previous['high_water'][column]} AND {column} <= {marks[column]}"
+    carried = previous.get('gaps', {}).get(column)
+    if carried:
+        where = f"({where}) OR {column} IN ({', '.join(str(key) for key in carried)})"
+    return where
+
+def archive_where(previous):
+    """bills_archive rows archived since the previous backup (with some overlap), or None for all of them."""
+    marks = previous['high_water']
+    if marks.get('archived_date') is None:
+        return None
+    return f"bill_date >= '{marks['archived_date']}' OR bill_no > {marks['archived_bill_no']}"
+
+def open_snapshot_sessions(settings, count):
+    """
+    `count` connections that all read the same instant of the database. Their
+    snapshots are started while FLUSH TABLES WITH READ LOCK holds off commits,
+    so every table dumped through them agrees with every other (the same
+    handshake mysqldump --single-transaction --source-data uses). Writes wait
+    only while the snapshots start, a few milliseconds; needs RELOAD.
+    """
+    sessions = [sql.connect(**settings, charset='utf8mb4') for _ in range(count)]
+    control = sql.connect(**settings)
+    try:
+        cur = control.cursor()
+        cur.execute("SET SESSION lock_wait_timeout = 10")  # give up rather than stall tills behind a long query
+        cur.execute("FLUSH TABLES WITH READ LOCK")
+        try:
+            for session in sessions:
+                session_cur = session.cursor()
+                session_cur.execute("SET SESSION TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                session_cur.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT")
+                session_cur.close()
+        finally:
+            cur.execute("UNLOCK TABLES")
+    except sql.Error:
+        for session in sessions:
+            session.close()
+        raise
+    finally:
+        control.close()
+    return sessions
+
+def backup_runs(directory, db_name):
+    """(run directory, manifest) of every completed backup of exactly db_name, oldest first."""
+    runs = []
+    for run in os.listdir(directory):
+        path = os.path.join(directory, run, 'manifest.json')
+        # the directory prefix alone would also match shop_2_... for shop
+        if run.startswith(f'{db_name}_') and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest['database'] == db_name:
+                runs.append((os.path.join(directory, run), manifest))
+    return sorted(runs, key=lambda run: run[1]['created'])
+
+def latest_manifest(db_name):
+    """Manifest of the most recent completed backup of db_name, or None."""
+    if not os.path.isdir(BACKUP_DIR):
+        return None
+    runs = backup_runs(BACKUP_DIR, db_name)
+    return runs[-1][1] if runs else None
+
+def open_compressed(path, compression):
+    if compression == 'zstd':
+        return zstandard.ZstdCompressor(level=3).stream_writer(open(path, 'wb'), closefd=True)
+    return gzip.open(path, 'wb', compresslevel=6)
+
+SQL_ESCAPES = str.maketrans({'\\': '\\\\', "'": "\\'", '\n': '\\n', '\r': '\\r', '\0': '\\0', '\x1a': '\\Z'})
+
+def sql_literal(value):
+    """A column value as a MySQL literal for the dump's INSERT statements."""
+    if value is None:
+        return 'NULL'
+    if isinstance(value, (bytes, bytearray)):
+        return '0x' + value.hex() if value else "''"
+    if isinstance(value, (int, float, Decimal)):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return f"'{value}'"
+    return "'" + str(value).translate(SQL_ESCAPES) + "'"
+
+def dump_table(session, table, out_dir, compression, where=None, data_only=False):
+    """
+    Stream one table from the session's snapshot through the compressor as
+    mysqldump-style SQL (CREATE TABLE, then extended INSERTs, one statement
+    per line); returns its manifest entry. data_only rows go on top of earlier
+    segments, which may already hold some of them, so they are upserts.
+    """
+    started = time.monotonic()
+    ext = 'zst' if compression == 'zstd' else 'gz'
+    file_name = f'{table}.sql.{ext}'
+    raw_bytes = 0
+    cur = session.cursor()
+    with open_compressed(os.path.join(out_dir, file_name), compression) as out:
+        def emit(text):
+            nonlocal raw_bytes
+            data = text.encode('utf-8')
+            raw_bytes += len(data)
+            out.write(data)
+        if not data_only:
+            cur.execute(f"SHOW CREATE TABLE `{table}`")
+            emit(f"DROP TABLE IF EXISTS `{table}`;\n{cur.fetchone()[1]};\n")
+        cur.execute(f"SELECT * FROM `{table}`" + (f" WHERE {where}" if where else ""))
+        upsert = ''
+        if data_only:
+            upsert = ' ON DUPLICATE KEY UPDATE ' + ','.join(f"`{column}`=VALUES(`{column}`)"
+                                                            for column in cur.column_names)
+        while True:
+            rows = cur.fetchmany(INSERT_ROWS)
+            if not rows:
+                break
+            if data_only and table == 'cust_info':
+                # a number that moved to one of these customers leaves its old
+                # holder first, the way replicate_customers() does on a store
+                phone = cur.column_names.index('phone_no')
+                phones = ','.join(sql_literal(row[phone]) for row in rows)
+                ids = ','.join(sql_literal(row[0]) for row in rows)
+                emit(f"UPDATE `cust_info` SET phone_no = CONCAT('~', cust_id) "
+                     f"WHERE phone_no IN ({phones}) AND cust_id NOT IN ({ids});\n")
+            values = ','.join('(' + ','.join(sql_literal(value) for value in row) + ')' for row in rows)
+            emit(f"INSERT INTO `{table}` VALUES {values}{upsert};\n")
+    cur.close()
+    return {
+        'file': file_name,
+        'where': where,
+        'raw_bytes': raw_bytes,
+        'bytes': os.path.getsize(os.path.join(out_dir, file_name)),
+        'seconds': round(time.monotonic() - started, 3),
+    }
+
+def run_backup(incremental=False, jobs=4, compression=None):
+    settings = db_settings()
+    db_name = settings['database']
+    compression = compression or ('zstd' if zstandard else 'gzip')
+    if compression == 'zstd' and zstandard is None:
+        raise RuntimeError("zstd requested but the zstandard package is not installed")
+    started = time.monotonic()
+    sessions = open_snapshot_sessions(settings, max(1, jobs))
+    tables, marks = read_marks(sessions[0])
+    previous = latest_manifest(db_name) if incremental else None
+    if incremental and previous is None:
+        print('No previous backup found; taking a full backup instead.')
+        incremental = False
 
-def main():
-    db_host = os.getenv('DB_HOST', 'localhost')
-    db_user = os.getenv('DB_USER', 'root')
-    db_password = os.getenv('DB_PASSWORD', '')
-    db_name = os.getenv('DB_NAME', 'project_cs')
     ts = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-    os.makedirs('backups', exist_ok=True)
-    out_file = os.path.join('backups', f'{db_name}_{ts}.sql')
-    cmd = [
-        'mysqldump',
-        f'-h{db_host}',
-        f'-u{db_user}',
-        f'-p{db_password}',
-        db_name
-    ]
+    out_dir = os.path.join(BACKUP_DIR, f'{db_name}_{ts}')
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Tables dump in parallel, one per session at a time, all from the same
+    # snapshot; the marks and the numbers still missing below them were read
+    # in it too, so the next incremental picks up exactly where this one stops.
+    gaps = {mark: missing_keys(sessions[0], table, mark, previous['high_water'][mark] if incremental else 0,
+                               marks[mark], previous.get('gaps', {}).get(mark, ()) if incremental else ())
+            for mark, table in MARK_TABLES.items()}
+    work = {}
+    for table in tables:
+        key = INCREMENTAL_KEYS.get(table)
+        if not incremental:
+            work[table] = f"{key} <= {marks[key]}" if key else None
+        elif key:
+            work[table] = incremental_where(key, previous, marks)
+        elif table == ARCHIVE_TABLES[0]:
+            work[table] = archive_where(previous)
+        elif table == ARCHIVE_TABLES[1]:
+            bills = archive_where(previous)
+            work[table] = bills and f"bill_no IN (SELECT bill_no FROM {ARCHIVE_TABLES[0]} WHERE {bills})"
+        else:
+            work[table] = None
+    if incremental and 'cust_info' in work:
+        work['cust_info'] = (f"({work['cust_info']}) OR cust_id IN "
+                             f"(SELECT cust_id FROM bills WHERE {incremental_where('bill_no', previous, marks)})")
+    # incrementals add the rows they carry to what's already restored
+    appended = set(INCREMENTAL_KEYS) | set(ARCHIVE_TABLES)
+
+    idle = queue.Queue()
+    for session in sessions:
+        idle.put(session)
+
+    def dump(table, where):
+        session = idle.get()
+        try:
+            return dump_table(session, table, out_dir, compression, where, incremental and table in appended)
+        finally:
+            idle.put(session)
     try:
-        with open(out_file, 'w', encoding='utf-8') as f:
-            subprocess.run(cmd, check=True, stdout=f)
-        print(f'Backup saved to {out_file}')
+        with ThreadPoolExecutor(max_workers=len(sessions)) as pool:
+            futures = {table: pool.submit(dump, table, where) for table, where in work.items()}
+            results = {table: future.result() for table, future in futures.items()}
+    finally:
+        for session in sessions:
+            session.close()
+
+    manifest = {
+        'database': db_name,
+        'created': ts,
+        'mode': 'incremental' if incremental else 'full',
+        'base': previous['created'] if incremental else None,
+        'compression': compression,
+        'high_water': marks,
+        'gaps': gaps,
+        'tables': results,
+        'total_bytes': sum(entry['bytes'] for entry in results.values()),
+        'seconds': round(time.monotonic() - started, 3),
+    }
+    with open(os.path.join(out_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return out_dir, manifest
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Back up the grocery database.')
+    parser.add_argument('--incremental', action='store_true',
+                        help='export bills and customers added since the last backup, plus the small tables whole')
+    parser.add_argument('--jobs', type=int, default=4, help='tables dumped in parallel (one connection each)')
+    parser.add_argument('--compression', choices=('gzip', 'zstd'),
+                        help='default: zstd if the zstandard package is installed, else gzip')
+    args = parser.parse_args(argv)
+    try:
+        out_dir, manifest = run_backup(args.incremental, args.jobs, args.compression)
+        print(f"{manifest['mode'].capitalize()} backup saved to {out_dir} "
+              f"({manifest['total_bytes']} bytes in {manifest['seconds']}s)")
     except Exception as e:
         print(f'Backup failed: {e}')
+        sys.exit(1)
 
 if __name__ == '__main__':
     main()
-
-
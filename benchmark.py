@@ -0,0 +1,257 @@
+import io
+import os
+import sys
+import json
+import builtins
+import time
+import random
+import argparse
+import datetime
+import contextlib
+import subprocess
+import http.client
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+import mysql.connector as sql
+import project_CS as app
+
+RESULTS_DIR = 'bench_results'
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+@contextlib.contextmanager
+def scripted_input(answers):
+    """Feed canned answers to input() and swallow printed output."""
+    replies = iter(answers)
+    original = builtins.input
+    builtins.input = lambda prompt='': next(replies, 'q')
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        builtins.input = original
+
+def run_case(name, operation, iterations, db_connection, cursor):
+    """Time `operation(cursor, db_connection)`; the pool's instrumented cursor counts round trips."""
+    latencies = []
+    trips = []
+    for _ in range(iterations):
+        cursor.round_trips = 0
+        started = time.perf_counter()
+        operation(cursor, db_connection)
+        latencies.append((time.perf_counter() - started) * 1000)
+        trips.append(cursor.round_trips)
+    result = {
+        'iterations': iterations,
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(max(latencies), 3),
+        'round_trips_avg': round(sum(trips) / len(trips), 2),
+    }
+    print(f"{name:<16} p50 {result['p50_ms']:>9.3f} ms  p95 {result['p95_ms']:>9.3f} ms  "
+          f"p99 {result['p99_ms']:>9.3f} ms  round trips {result['round_trips_avg']}")
+    return result
+
+def bench_adapter(supplier, products):
+    """Supplier adapter for benchmarks: confirms a zero restock without sleeping or prompting."""
+    return {p_id: 0 for p_id, _, _ in products}
+
+def product_id_bounds(cursor):
+    """(first, last) p_id of the store; stores other than 1 number products from their own range."""
+    cursor.execute("SELECT MIN(p_id), MAX(p_id) FROM stock")
+    first, last = cursor.fetchone()
+    return first or 1, last or 1
+
+def build_cases(cursor, rng, cart_size):
+    first_p_id, max_p_id = product_id_bounds(cursor)
+    cursor.execute("SELECT MAX(cust_id) FROM cust_info")
+    max_cust_id = cursor.fetchone()[0] or 1
+    cursor.execute("SELECT name FROM stock ORDER BY p_id LIMIT 200")
+    words = [word for (name,) in cursor.fetchall() for word in name.split()] or ['rice']
+
+    def search(cur, conn):
+        app.search_products(cur, rng.choice(words)[:rng.randint(3, 6)])
+
+    def bill(cur, conn):
+        # popular products dominate real baskets; quantity 1 keeps stock from running out
+        lines = [(min(max_p_id, first_p_id - 1 + int(rng.paretovariate(1.2))), 1) for _ in range(cart_size)]
+        app.finalize_cart(cur, conn, rng.randint(1, max_cust_id), lines)
+
+    def check_stock(cur, conn):
+        with scripted_input(['q']):
+            app.check_stock(cur)
+
+    def check_stock_low(cur, conn):
+        with scripted_input(['q']):
+            app.check_stock(cur, low_stock_only=True)
+
+    def cust_info(cur, conn):
+        with scripted_input(['q']):
+            app.cust_info(cur)
+
+    def check_reorder(cur, conn):
+        with scripted_input([]):
+            app.check_reorder(cur, conn)
+
+    def check_total_profits(cur, conn):
+        with scripted_input([]):
+            app.check_total_profits(cur)
+
+    return {
+        'search': search,
+        'bill': bill,
+        'check_stock': check_stock,
+        'check_stock_low': check_stock_low,
+        'cust_info': cust_info,
+        'check_reorder': check_reorder,
+        'check_total_profits': check_total_profits,
+    }
+
+def post_carts(url, token, payloads):
+    """One keep-alive client posting its carts in turn; returns (latencies_ms, statuses)."""
+    target = urlsplit(url)
+    conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=60)
+    headers = {'Content-Type': 'application/json', 'Authorization': f'Bearer {token}'}
+    latencies = []
+    statuses = []
+    try:
+        for payload in payloads:
+            started = time.perf_counter()
+            conn.request('POST', '/carts/checkout', json.dumps(payload), headers)
+            response = conn.getresponse()
+            response.read()
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses.append(response.status)
+    finally:
+        conn.close()
+    return latencies, statuses
+
+def bench_service(args, rng):
+    """Drive checkout_service.py with `--concurrency` clients and report carts/sec."""
+    token = args.token or os.getenv('CHECKOUT_TOKEN') or app.load_till_session()
+    if not token:
+        print("No session token: pass --token, set CHECKOUT_TOKEN or log in on this till first.")
+        sys.exit(1)
+    with app.checkout() as (db_connection, cursor):
+        first_p_id, max_p_id = product_id_bounds(cursor)
+        cursor.execute("SELECT phone_no FROM cust_info ORDER BY cust_id LIMIT 1000")
+        phones = [phone for (phone,) in cursor.fetchall()] or ['9999999999']
+    payloads = [{'phone': rng.choice(phones), 'name': 'Benchmark',
+                 'lines': [[min(max_p_id, first_p_id - 1 + int(rng.paretovariate(1.2))), 1]
+                           for _ in range(args.cart_size)]}
+                for _ in range(args.carts)]
+    shares = [payloads[i::args.concurrency] for i in range(args.concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        outcomes = list(pool.map(lambda share: post_carts(args.service, token, share), shares))
+    seconds = time.perf_counter() - started
+    latencies = [ms for share, _ in outcomes for ms in share]
+    statuses = [status for _, share in outcomes for status in share]
+    ok = statuses.count(200)
+    result = {
+        'carts': len(statuses),
+        'ok': ok,
+        'concurrency': args.concurrency,
+        'seconds': round(seconds, 3),
+        'carts_per_sec': round(ok / max(seconds, 1e-6), 2),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+    }
+    print(f"service          {result['carts_per_sec']} carts/s ({ok}/{len(statuses)} ok, "
+          f"{args.concurrency} clients)  p50 {result['p50_ms']:.3f} ms  p95 {result['p95_ms']:.3f} ms")
+    return {'service': result}
+
+# What a restarted till does before its menu shows, timed inside a fresh interpreter.
+STARTUP_PROBE = """
+import json, time
+started = time.perf_counter()
+import project_CS as app
+imported = time.perf_counter()
+db_connection, cursor = app.connect_to_database()
+connected = time.perf_counter()
+app.migrate_shards(db_connection, cursor, [app.STORE_ID], use_cache=True)
+if app.resume_till_session(cursor) is None:
+    cursor.execute("SELECT 1 FROM users LIMIT 1")
+    cursor.fetchall()
+ready = time.perf_counter()
+print(json.dumps({'import_ms': (imported - started) * 1000, 'connect_ms': (connected - imported) * 1000,
+                  'session_ms': (ready - connected) * 1000}))
+"""
+
+def bench_startup(runs):
+    """Cold-start a till `runs` times; reports interpreter-to-menu time and its parts."""
+    phases = {'total_ms': [], 'import_ms': [], 'connect_ms': [], 'session_ms': []}
+    for _ in range(runs):
+        started = time.perf_counter()
+        proc = subprocess.run([sys.executable, '-c', STARTUP_PROBE], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(app.__file__)))
+        total_ms = (time.perf_counter() - started) * 1000
+        if proc.returncode != 0:
+            print(proc.stdout + proc.stderr)
+            sys.exit(1)
+        timings = json.loads(proc.stdout.strip().splitlines()[-1])
+        phases['total_ms'].append(total_ms)
+        for name, value in timings.items():
+            phases[name].append(value)
+    result = {'runs': runs}
+    for name, samples in phases.items():
+        result[name.replace('_ms', '_p50_ms')] = round(percentile(samples, 50), 3)
+        result[name.replace('_ms', '_p95_ms')] = round(percentile(samples, 95), 3)
+    print(f"startup          p50 {result['total_p50_ms']:>9.3f} ms  p95 {result['total_p95_ms']:>9.3f} ms  "
+          f"(import {result['import_p50_ms']:.1f}, connect {result['connect_p50_ms']:.1f}, "
+          f"session {result['session_p50_ms']:.1f} ms)")
+    return {'startup': result}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the checkout and reporting hot paths. Writes real bills: use a scratch database.')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--cart-size', type=int, default=40)
+    parser.add_argument('--cases', nargs='*', help='subset of cases to run (default: all)')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', help=f'results file (default: {RESULTS_DIR}/<timestamp>.json)')
+    parser.add_argument('--service', metavar='URL',
+                        help='load-test a running checkout_service.py instead, e.g. http://127.0.0.1:8080')
+    parser.add_argument('--concurrency', type=int, default=16, help='parallel clients for --service')
+    parser.add_argument('--carts', type=int, default=1000, help='carts posted with --service')
+    parser.add_argument('--token', help='session token for --service (default: CHECKOUT_TOKEN or .till_session)')
+    parser.add_argument('--startup', type=int, metavar='RUNS',
+                        help='instead time RUNS cold starts of a till (import, connect, schema and session check)')
+    args = parser.parse_args(argv)
+    rng = random.Random(args.seed)
+    app.SUPPLIER_ADAPTERS['bench'] = bench_adapter
+    os.environ['SUPPLIER_ADAPTER'] = 'bench'
+    results = {}
+    try:
+        if args.startup:
+            results = bench_startup(args.startup)
+        elif args.service:
+            results = bench_service(args, rng)
+        else:
+            with app.checkout() as (db_connection, cursor):
+                cases = build_cases(cursor, rng, args.cart_size)
+                for name in args.cases or cases:
+                    iterations = max(1, args.iterations // 10) if name == 'check_reorder' else args.iterations
+                    results[name] = run_case(name, cases[name], iterations, db_connection, cursor)
+    except sql.Error as e:
+        print(f"Benchmark failed: {e}")
+        sys.exit(1)
+    finally:
+        app.stop_receipt_writer()
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, datetime.datetime.now().strftime('%Y%m%d_%H%M%S') + '.json')
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'created': datetime.datetime.now().isoformat(timespec='seconds'),
+                   'settings': vars(args), 'results': results,
+                   'statements': app.metrics_snapshot()['statements']}, f, indent=2, sort_keys=True)
+    print(f"Results written to {output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+import mysql.connector as sql
+import project_CS as app
+
+# Headless checkout over HTTP/JSON for tills and self-checkout kiosks. Requests
+# are parsed on the event loop; every database call runs on a worker thread
+# holding one pooled connection, so the worker count matches DB_POOL_SIZE.
+MAX_BODY_BYTES = 1 << 20
+TOKEN_CACHE_SECONDS = 60   # how long a checked session token is trusted without a query
+TOKEN_SWEEP_SECONDS = 5    # how often cached tokens are pruned and re-checked for revocation
+RATE_WINDOW_SECONDS = 60
+# What a till or kiosk shows for a bill line; cost and profit stay on the server.
+RECEIPT_ITEM_FIELDS = ('p_id', 'name', 'quantity', 'unit_price', 'tax_rate', 'line_total')
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found',
+               405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large',
+               500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class CheckoutService:
+    def __init__(self, workers):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='checkout')
+        self.started = time.monotonic()
+        self.carts = 0
+        self.failed = 0
+        self.recent = deque()  # completion times inside the rate window
+        self.tokens = {}       # token -> (user, checked_at), pruned by sweep_tokens()
+
+    # -------------------------
+    # Database work (runs on worker threads)
+    # -------------------------
+    def _resume(self, token):
+        with app.checkout('resume_session', shard=app.HOME) as (_, cursor):
+            return app.resume_session(cursor, token)
+
+    def _checkout(self, payload):
+        store_id = payload.get('store_id')  # kiosks of several stores can share one service
+        with app.checkout('checkout_cart', shard=store_id) as (db_connection, cursor):
+            return app.checkout_cart(cursor, db_connection, str(payload.get('phone', '')).strip(),
+                                     payload.get('lines') or [], payload.get('name', ''),
+                                     payload.get('address', ''), store_id)
+
+    def _revoked(self, session_ids):
+        """The cached sessions revoked, or whose user was disabled, since they were checked."""
+        placeholders = ', '.join(['%s'] * len(session_ids))
+        with app.checkout('revoked_sessions', shard=app.HOME) as (_, cursor):
+            cursor.execute(f"""
+                SELECT s.session_id FROM sessions s
+                INNER JOIN users u ON u.user_id = s.user_id
+                WHERE s.session_id IN ({placeholders}) AND (s.revoked = 1 OR u.active = 0)
+            """, tuple(session_ids))
+            return {row[0] for row in cursor.fetchall()}
+
+    def _search(self, text, limit, store_id=None):
+        with app.checkout('search', shard=store_id) as (_, cursor):
+            return app.search_products(cursor, text, limit, store_id)
+
+    async def run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    # -------------------------
+    # Routes
+    # -------------------------
+    async def authenticate(self, headers):
+        auth = headers.get('authorization', '')
+        if not auth.startswith('Bearer '):
+            raise HTTPError(401, 'missing bearer token')
+        token = auth[len('Bearer '):].strip()
+        cached = self.tokens.get(token)
+        if cached and time.monotonic() - cached[1] < TOKEN_CACHE_SECONDS:
+            return cached[0]
+        user = await self.run(self._resume, token)
+        if user is None:
+            self.tokens.pop(token, None)
+            raise HTTPError(401, 'invalid or expired session')
+        self.tokens[token] = (user, time.monotonic())
+        return user
+
+    async def sweep_tokens(self):
+        """Drop expired cache entries, and revoked ones without waiting for them to expire."""
+        while True:
+            await asyncio.sleep(TOKEN_SWEEP_SECONDS)
+            now = time.monotonic()
+            for token, (_, checked_at) in list(self.tokens.items()):
+                if now - checked_at >= TOKEN_CACHE_SECONDS:
+                    del self.tokens[token]
+            if not self.tokens:
+                continue
+            try:
+                revoked = await self.run(self._revoked, sorted({user['session_id'] for user, _ in self.tokens.values()}))
+            except sql.Error as e:
+                print(f"Token revocation check failed: {e}")
+                continue
+            for token, (user, _) in list(self.tokens.items()):
+                if user['session_id'] in revoked:
+                    self.tokens.pop(token, None)
+
+    async def checkout_route(self, headers, query, body):
+        await self.authenticate(headers)
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError:
+            raise HTTPError(400, 'body must be JSON')
+        if not isinstance(payload, dict) or not payload.get('lines'):
+            raise HTTPError(400, 'expected {"phone": ..., "lines": [[p_id, quantity], ...]}')
+        try:
+            result = await self.run(self._checkout, payload)
+        except (ValueError, TypeError) as e:
+            self.failed += 1
+            raise HTTPError(400, str(e))
+        if not result['items']:
+            self.failed += 1
+            raise HTTPError(409, {'error': 'no line could be billed', 'rejected': result['rejected']})
+        self.carts += 1
+        self.recent.append(time.monotonic())
+        return 200, {
+            'bill_no': result['bill_no'],
+            'invoice_no': result['invoice_no'],
+            'bill_date': result['bill_date'],
+            'items': [{field: item[field] for field in RECEIPT_ITEM_FIELDS} for item in result['items']],
+            'rejected': result['rejected'],
+            'subtotal': result['subtotal'],
+            'gst': result['gst'],
+            'grand_total': result['grand_total'],
+        }
+
+    async def search_route(self, headers, query, body):
+        await self.authenticate(headers)
+        text = query.get('q', [''])[0]
+        limit = min(int(query.get('limit', ['10'])[0]), 100)
+        store_id = query.get('store_id', [None])[0]
+        rows = await self.run(self._search, text, limit, store_id)
+        return 200, [{'p_id': p_id, 'name': name, 'price': price, 'quantity': quantity}
+                     for p_id, name, price, quantity in rows]
+
+    async def health_route(self, headers, query, body):
+        return 200, {'status': 'ok'}
+
+    async def stats_route(self, headers, query, body):
+        now = time.monotonic()
+        while self.recent and now - self.recent[0] > RATE_WINDOW_SECONDS:
+            self.recent.popleft()
+        uptime = now - self.started
+        window = min(uptime, RATE_WINDOW_SECONDS)
+        return 200, {
+            'uptime_seconds': round(uptime, 1),
+            'carts': self.carts,
+            'failed': self.failed,
+            'carts_per_sec': round(self.carts / max(uptime, 1e-6), 2),
+            'carts_per_sec_recent': round(len(self.recent) / max(window, 1e-6), 2),
+            'metrics': app.metrics_snapshot(),
+        }
+
+    def route(self, method, path):
+        routes = {
+            '/carts/checkout': ('POST', self.checkout_route),
+            '/products/search': ('GET', self.search_route),
+            '/health': ('GET', self.health_route),
+            '/stats': ('GET', self.stats_route),
+        }
+        if path not in routes:
+            raise HTTPError(404, f'no route for {path}')
+        allowed, handler = routes[path]
+        if method != allowed:
+            raise HTTPError(405, f'{path} expects {allowed}')
+        return handler
+
+    # -------------------------
+    # HTTP/1.1 plumbing
+    # -------------------------
+    async def read_request(self, reader):
+        """(method, path, query, headers, body), or None when the client closed the connection."""
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, target, _ = request_line.decode('latin-1').split(' ', 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length', '0'))
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, 'request body too large')
+        body = await reader.readexactly(length) if length else b''
+        url = urlsplit(target)
+        return method.upper(), url.path, parse_qs(url.query), headers, body
+
+    def write_response(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload, default=str).encode('utf-8')
+        writer.write((f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                      f"Content-Type: application/json\r\n"
+                      f"Content-Length: {len(body)}\r\n"
+                      f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode('latin-1') + body)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await self.read_request(reader)
+                    if request is None:
+                        break
+                    method, path, query, headers, body = request
+                    keep_alive = headers.get('connection', '').lower() != 'close'
+                    status, payload = await self.route(method, path)(headers, query, body)
+                except HTTPError as e:
+                    status, payload = e.status, e.args[0] if isinstance(e.args[0], dict) else {'error': e.args[0]}
+                except sql.Error as e:
+                    status, payload = 503, {'error': f'database error: {e}'}
+                except (ValueError, asyncio.IncompleteReadError):
+                    status, payload = 400, {'error': 'malformed request'}
+                self.write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+async def serve(host, port):
+    app.init_pool()
+    app.start_receipt_writer()
+    service = CheckoutService(int(os.getenv('DB_POOL_SIZE', '5')))
+    sweeper = asyncio.create_task(service.sweep_tokens())  # keep a reference so the task isn't collected
+    server = await asyncio.start_server(service.handle, host, port)
+    print(f"Checkout service listening on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve checkout over HTTP/JSON for tills and kiosks.')
+    parser.add_argument('--host', default=os.getenv('CHECKOUT_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('CHECKOUT_PORT', '8080')))
+    args = parser.parse_args(argv)
+    try:
+        with app.checkout(shard=app.HOME) as (db_connection, cursor):
+            if not app.migrate_shards(db_connection, cursor):
+                sys.exit(1)
+        asyncio.run(serve(args.host, args.port))
+    except sql.Error as e:
+        print(f"Error starting checkout service: {e}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print("Checkout service stopped")
+
+if __name__ == '__main__':
+    main()
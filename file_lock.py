@@ -0,0 +1,38 @@
+import os
+
+# Exclusive, non-blocking locks on an open file descriptor, for files several
+# processes on one machine write (the bill journal, receipt segments). The OS
+# drops them when the process exits, so a crashed writer never leaves a stale
+# lock behind.
+if os.name == 'nt':
+    import msvcrt
+
+    # Windows byte locks are mandatory, so lock a byte far past any real
+    # content: other processes can still read a locked receipt index.
+    LOCK_OFFSET = 0x7FFFFFFE
+
+    def try_lock(fd):
+        """True if this process now holds the lock on fd, False if another one does."""
+        os.lseek(fd, LOCK_OFFSET, os.SEEK_SET)
+        try:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def unlock(fd):
+        os.lseek(fd, LOCK_OFFSET, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def try_lock(fd):
+        """True if this process now holds the lock on fd, False if another one does."""
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def unlock(fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
@@ -0,0 +1,157 @@
+import sys
+import time
+import random
+import argparse
+import datetime
+from bisect import bisect
+from itertools import accumulate
+import mysql.connector as sql
+import project_CS as app
+
+# Word lists the product names are assembled from; a handful of brands and
+# suppliers carry most of the catalog, like real stores.
+ADJECTIVES = ['Fresh', 'Organic', 'Classic', 'Premium', 'Daily', 'Golden', 'Farm', 'Royal', 'Pure', 'Spicy']
+ITEMS = ['Rice', 'Flour', 'Sugar', 'Oil', 'Salt', 'Tea', 'Coffee', 'Lentils', 'Biscuits', 'Bread',
+         'Butter', 'Milk', 'Eggs', 'Cheese', 'Yogurt', 'Juice', 'Noodles', 'Soap', 'Honey', 'Jam']
+SIZES = ['100g', '250g', '500g', '1kg', '2kg', '5kg', '500ml', '1L', 'Pack of 6', 'Pack of 12']
+TAX_RATE = '18.00'
+
+def zipf_sampler(n, skew, rng):
+    """Return a function drawing k ids from 1..n with Zipf-like popularity (id 1 most popular)."""
+    cum_weights = list(accumulate(1.0 / (rank ** skew) for rank in range(1, n + 1)))
+    total = cum_weights[-1]
+
+    def sample(k):
+        return [bisect(cum_weights, rng.random() * total) + 1 for _ in range(k)]
+    return sample
+
+def insert_chunked(cursor, db_connection, query, rows, chunk_size):
+    for start in range(0, len(rows), chunk_size):
+        cursor.executemany(query, rows[start:start + chunk_size])
+        db_connection.commit()
+
+def reset_tables(cursor, db_connection):
+    # children before the tables they reference: sales_velocity and profits point at stock
+    for table in ('billitems', 'bills', 'billitems_archive', 'bills_archive', 'journal_applied',
+                  'sales_by_product', 'sales_daily', 'sales_velocity', 'profits', 'stock', 'cust_info'):
+        cursor.execute(f"DELETE FROM {table}")
+    db_connection.commit()
+
+def generate_products(cursor, db_connection, count, rng, chunk_size):
+    brands = [f"Brand{i}" for i in range(1, max(2, count // 50) + 1)]
+    suppliers = [f"Supplier{i}" for i in range(1, max(2, count // 500) + 1)]
+    pick_brand = zipf_sampler(len(brands), 1.1, rng)
+    pick_supplier = zipf_sampler(len(suppliers), 1.1, rng)
+    prices = {}
+    stock_rows = []
+    profit_rows = []
+    base = (app.STORE_ID - 1) * app.STORE_ID_SPAN  # stay inside this store's p_id range
+    for p_id in range(base + 1, base + count + 1):
+        price = rng.randint(5, 500)
+        prices[p_id] = price
+        name = f"{rng.choice(ADJECTIVES)} {rng.choice(ITEMS)} {rng.choice(SIZES)}"
+        stock_rows.append((p_id, name, price, rng.randint(0, 5000), brands[pick_brand(1)[0] - 1],
+                           suppliers[pick_supplier(1)[0] - 1]))
+        profit_rows.append((p_id, max(1, price // rng.randint(5, 12))))
+    insert_chunked(cursor, db_connection, """
+        INSERT INTO stock (p_id, name, price, quantity, brand, supplier)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """, stock_rows, chunk_size)
+    insert_chunked(cursor, db_connection, "INSERT INTO profits (p_id, profit) VALUES (%s, %s)",
+                   profit_rows, chunk_size)
+    return prices
+
+def generate_customers(cursor, db_connection, count, rng, chunk_size):
+    """Customers belong to home; a store with its own database also gets the copies its bills reference."""
+    query = "INSERT INTO cust_info (cust_id, phone_no, name, address) VALUES (%s, %s, %s, %s)"
+    with app.home_checkout(db_connection, cursor) as (home_connection, home_cursor):
+        rows = []
+        for cust_id in range(1, count + 1):
+            rows.append((cust_id, str(6000000000 + cust_id), f"Customer {cust_id}", f"{rng.randint(1, 999)} Market Road"))
+            if len(rows) >= chunk_size or cust_id == count:
+                insert_chunked(home_cursor, home_connection, query, rows, chunk_size)
+                if not app.is_home():
+                    insert_chunked(cursor, db_connection, query, rows, chunk_size)
+                rows = []
+
+def generate_bills(cursor, db_connection, billitems, customers, prices, days, rng, chunk_size):
+    """Spread bills over the last `days` days; basket sizes average about 8 lines."""
+    p_ids = list(prices)
+    pick_product = zipf_sampler(len(p_ids), 1.05, rng)
+    pick_customer = zipf_sampler(customers, 0.8, rng)
+    today = datetime.date.today()
+    bill_rows = []
+    item_rows = []
+    bill_no = (app.STORE_ID - 1) * app.STORE_ID_SPAN  # stay inside this store's bill_no range
+    written = 0
+    while written < billitems:
+        bill_no += 1
+        lines = min(billitems - written, max(1, int(rng.expovariate(1 / 8))))
+        subtotal = 0
+        for p_id in (p_ids[rank - 1] for rank in pick_product(lines)):
+            qty = rng.randint(1, 5)
+            subtotal += prices[p_id] * qty
+            item_rows.append((bill_no, p_id, qty, prices[p_id], TAX_RATE, prices[p_id] * qty))
+        written += lines
+        # bills are written oldest first so bill_no and bill_date grow together
+        days_ago = max(0, days - 1 - int(written * days / billitems))
+        bill_date = today - datetime.timedelta(days=days_ago)
+        bill_rows.append((bill_no, pick_customer(1)[0], bill_date, subtotal))
+        if len(item_rows) >= chunk_size:
+            flush_bills(cursor, db_connection, bill_rows, item_rows)
+            bill_rows, item_rows = [], []
+            print(f"  {written}/{billitems} billitems", end='\r')
+    if bill_rows:
+        flush_bills(cursor, db_connection, bill_rows, item_rows)
+    print()
+    return bill_no - (app.STORE_ID - 1) * app.STORE_ID_SPAN
+
+def flush_bills(cursor, db_connection, bill_rows, item_rows):
+    cursor.executemany("INSERT INTO bills (bill_no, cust_id, bill_date, total_price) VALUES (%s, %s, %s, %s)",
+                       bill_rows)
+    cursor.executemany("""
+        INSERT INTO billitems (bill_no, p_id, quantity, unit_price, tax_rate, line_total)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """, item_rows)
+    db_connection.commit()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fill the database with synthetic, skewed data for benchmarking.')
+    parser.add_argument('--products', type=int, default=100_000)
+    parser.add_argument('--customers', type=int, default=1_000_000)
+    parser.add_argument('--billitems', type=int, default=1_000_000)
+    parser.add_argument('--days', type=int, default=365, help='history length bills are spread over')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--reset', action='store_true', help='delete existing products, customers and bills first')
+    args = parser.parse_args(argv)
+    rng = random.Random(args.seed)
+    try:
+        with app.checkout(shard=app.HOME) as (db_connection, cursor):
+            if not app.migrate_shards(db_connection, cursor, [app.STORE_ID]):
+                sys.exit(1)
+        # everything below lands in this till's store (STORE_ID); with a shard
+        # map, generate one store at a time by setting STORE_ID
+        with app.checkout() as (db_connection, cursor):
+            if args.reset:
+                reset_tables(cursor, db_connection)
+                if not app.is_home():
+                    with app.checkout(shard=app.HOME) as (home_connection, home_cursor):
+                        home_cursor.execute("DELETE FROM cust_info")
+                        home_connection.commit()
+            started = time.monotonic()
+            print(f"Generating {args.products} products...")
+            prices = generate_products(cursor, db_connection, args.products, rng, args.chunk_size)
+            print(f"Generating {args.customers} customers...")
+            generate_customers(cursor, db_connection, args.customers, rng, args.chunk_size)
+            print(f"Generating {args.billitems} billitems...")
+            bills = generate_bills(cursor, db_connection, args.billitems, args.customers, prices, args.days,
+                                   rng, args.chunk_size)
+            app.backfill_sales_summary(cursor, db_connection)
+            print(f"Generated {bills} bills in {time.monotonic() - started:.1f}s")
+    except sql.Error as e:
+        print(f"Error generating data: {e}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,371 @@
 #!/usr/bin/env python3
 import mysql.connector as sql
-from datetime import date
+from mysql.connector import pooling
+from contextlib import contextmanager
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
 import time as t
 import os
+import hmac
+import hashlib
+import secrets
+import uuid
+import csv
+import json
+import queue
+import atexit
+import threading
+import sys
+import argparse
+import re
+import bisect
+import heapq
+import math
+import receipt_store
+import file_lock
 from decimal import Decimal, ROUND_HALF_UP
 try:
     from dotenv import load_dotenv
-    load_dotenv()
+    load_dotenv()  # finds .env in the script's directory or any parent
 except Exception:
     pass
-import bcrypt
+# bcrypt is imported only when a password is hashed or checked: most till
+# restarts resume a session without hashing anything.
+
+# -------------------------
+# Query instrumentation
+# -------------------------
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG', 'slow_queries.log')
+METRICS_FILE = os.getenv('METRICS_FILE')  # .prom for Prometheus text, anything else for JSON
+LOCK_ERRORS = {1205: 'lock_wait_timeout', 1213: 'deadlock'}
+# The connector folds executemany into one multi-row statement only for INSERT ... VALUES;
+# anything else (UPDATE, DELETE, INSERT ... SELECT) is sent once per parameter set.
+BATCHED_STATEMENT = re.compile(r'\s*INSERT\s.*\sVALUES\s*\(', re.I | re.S)
+_metrics_lock = threading.Lock()
+_metrics = {'statements': {}, 'operations': {}, 'lock_errors': {}, 'caches': {}}
+
+def normalize_statement(statement):
+    """Collapse whitespace and variable-length IN lists so similar statements share one entry."""
+    text = ' '.join(str(statement).split())
+    text = re.sub(r'(WHEN %s THEN %s ?)+', 'WHEN %s THEN %s ... ', text)
+    return re.sub(r'%s(, %s)+', '%s, ...', text)[:300]
+
+def record_statement(statement, elapsed_ms, params=None):
+    key = normalize_statement(statement)
+    with _metrics_lock:
+        entry = _metrics['statements'].setdefault(key, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0})
+        entry['count'] += 1
+        entry['total_ms'] += elapsed_ms
+        entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+    if elapsed_ms >= SLOW_QUERY_MS:
+        try:
+            with open(SLOW_QUERY_LOG, 'a', encoding='utf-8') as f:
+                f.write(f"{t.strftime('%Y-%m-%d %H:%M:%S')}\t{elapsed_ms:.1f}ms\t{key}\t{str(params)[:200]}\n")
+        except OSError:
+            pass
+    return key
+
+def record_rows(key, rows):
+    if key is None or not rows:
+        return
+    with _metrics_lock:
+        _metrics['statements'][key]['rows'] += rows
+
+def record_error(error):
+    name = LOCK_ERRORS.get(getattr(error, 'errno', None))
+    if name:
+        with _metrics_lock:
+            _metrics['lock_errors'][name] = _metrics['lock_errors'].get(name, 0) + 1
+
+def record_operation(name, round_trips, elapsed_ms):
+    with _metrics_lock:
+        entry = _metrics['operations'].setdefault(name, {'count': 0, 'round_trips': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+        entry['count'] += 1
+        entry['round_trips'] += round_trips
+        entry['total_ms'] += elapsed_ms
+        entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+
+def record_cache(name, event):
+    """Count a cache event ('hits', 'misses', 'evictions', 'invalidations')."""
+    with _metrics_lock:
+        entry = _metrics['caches'].setdefault(name, {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0})
+        entry[event] += 1
+
+class InstrumentedCursor:
+    """
+    Cursor proxy that times every statement, counts the rows fetched from it
+    and the round trips made through this cursor. Everything else is passed
+    through to the real cursor.
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._last_key = None
+        self.round_trips = 0
+
+    def _timed(self, method, statement, params, round_trips=1):
+        self.round_trips += round_trips
+        started = t.perf_counter()
+        try:
+            return method(statement, params)
+        except sql.Error as e:
+            record_error(e)
+            raise
+        finally:
+            self._last_key = record_statement(statement, (t.perf_counter() - started) * 1000, params)
+
+    def execute(self, statement, params=None):
+        return self._timed(self._cursor.execute, statement, params)
+
+    def executemany(self, statement, seq_params):
+        seq_params = list(seq_params)
+        if not seq_params:
+            round_trips = 0
+        elif BATCHED_STATEMENT.match(str(statement)):
+            round_trips = 1
+        else:
+            round_trips = len(seq_params)
+        return self._timed(self._cursor.executemany, statement, seq_params, round_trips)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            record_rows(self._last_key, 1)
+        return row
+
+    def fetchmany(self, size=1):
+        rows = self._cursor.fetchmany(size)
+        record_rows(self._last_key, len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        record_rows(self._last_key, len(rows))
+        return rows
+
+    def __iter__(self):
+        key = self._last_key
+        count = 0
+        try:
+            for row in self._cursor:
+                count += 1
+                yield row
+        finally:
+            record_rows(key, count)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+def metrics_snapshot():
+    with _metrics_lock:
+        return json.loads(json.dumps(_metrics))
+
+def _prom_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+def export_metrics(path=None):
+    """Write the current metrics to path (Prometheus text if it ends in .prom, else JSON)."""
+    path = path or METRICS_FILE
+    if not path:
+        return None
+    snapshot = metrics_snapshot()
+    if path.endswith('.prom'):
+        lines = []
+        for key, entry in snapshot['statements'].items():
+            label = f'statement="{_prom_label(key)}"'
+            lines.append(f"grocery_statement_total{{{label}}} {entry['count']}")
+            lines.append(f"grocery_statement_seconds_sum{{{label}}} {entry['total_ms'] / 1000:.6f}")
+            lines.append(f"grocery_statement_seconds_max{{{label}}} {entry['max_ms'] / 1000:.6f}")
+            lines.append(f"grocery_statement_rows_total{{{label}}} {entry['rows']}")
+        for name, entry in snapshot['operations'].items():
+            label = f'operation="{_prom_label(name)}"'
+            lines.append(f"grocery_operation_total{{{label}}} {entry['count']}")
+            lines.append(f"grocery_operation_round_trips_total{{{label}}} {entry['round_trips']}")
+            lines.append(f"grocery_operation_seconds_sum{{{label}}} {entry['total_ms'] / 1000:.6f}")
+            lines.append(f"grocery_operation_seconds_max{{{label}}} {entry['max_ms'] / 1000:.6f}")
+        for name, count in snapshot['lock_errors'].items():
+            lines.append(f'grocery_lock_errors_total{{error="{name}"}} {count}')
+        for name, entry in snapshot['caches'].items():
+            for event, count in entry.items():
+                lines.append(f'grocery_cache_events_total{{cache="{name}",event="{event}"}} {count}')
+        text = "\n".join(lines) + "\n"
+    else:
+        text = json.dumps(snapshot, indent=2, sort_keys=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+    return path
+
+atexit.register(export_metrics)
 
 # -------------------------
 # Database helpers
 # -------------------------
-def connect_to_database():
+# Stores and shards: the home database holds users, sessions and customers;
+# each store's stock, bills and billitems live in that store's database
+# (which carries the full schema, plus copies of the customers who bought
+# there for the bills foreign key). Without a shard map file the one database
+# from db_config() is both home and store STORE_ID, exactly as before.
+HOME = 'home'
+STORE_ID = int(os.getenv('STORE_ID', '1'))
+SHARD_MAP_FILE = os.getenv('SHARD_MAP', 'shards.json')
+STORE_ID_SPAN = 10_000_000  # bill_nos and p_ids per store: store k numbers both from (k - 1) * SPAN + 1
+_shard_map = None
+_pools = {}
+_pool_lock = threading.Lock()
+
+def db_config():
+    return {
+        'host': os.getenv('DB_HOST', 'localhost'),
+        'user': os.getenv('DB_USER', 'root'),
+        'password': os.getenv('DB_PASSWORD', '1401'),
+        'database': os.getenv('DB_NAME', 'project_cs'),
+        'charset': 'utf8',
+    }
+
+def shard_map():
+    """
+    {'home': config, 'stores': {store_id: config}}. SHARD_MAP_FILE holds
+    {"home": {...}, "stores": {"1": {...}, "2": {...}}}; each entry only needs
+    the settings that differ from db_config().
+    """
+    global _shard_map
+    if _shard_map is None:
+        base = db_config()
+        try:
+            with open(SHARD_MAP_FILE, encoding='utf-8') as f:
+                layout = json.load(f)
+        except FileNotFoundError:
+            layout = {}
+        stores = {int(store_id): dict(base, **config) for store_id, config in layout.get('stores', {}).items()}
+        _shard_map = {'home': dict(base, **layout.get('home', {})), 'stores': stores or {STORE_ID: base}}
+    return _shard_map
+
+def store_ids():
+    return sorted(shard_map()['stores'])
+
+def shard_config(shard=None):
+    """Connection settings for HOME, a store_id, or None for this till's store."""
+    if shard == HOME:
+        return shard_map()['home']
+    store_id = STORE_ID if shard is None else int(shard)
+    try:
+        return shard_map()['stores'][store_id]
+    except KeyError:
+        raise ValueError(f"store {store_id} is not in the shard map") from None
+
+def shard_key(shard=None):
+    config = shard_config(shard)
+    return (config['host'], config.get('port', 3306), config['database'])
+
+def is_home(shard=None):
+    """True when the store's tables share the home database (always, without a shard map)."""
+    return shard_key(shard) == shard_key(HOME)
+
+def store_for_bill(bill_no):
+    return (bill_no - 1) // STORE_ID_SPAN + 1
+
+def init_pool(shard=None):
+    """
+    Create (once per database) the connection pool for a shard, sized by
+    DB_POOL_SIZE (default 5). Only the first connection is opened here; the
+    rest are added by a background thread so startup pays for one handshake,
+    not pool_size.
+    """
+    key = shard_key(shard)
+    with _pool_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool_size = int(os.getenv('DB_POOL_SIZE', '5'))
+            pool = pooling.MySQLConnectionPool(pool_name=f'grocery-{len(_pools)}', pool_size=pool_size,
+                                               pool_reset_session=True)
+            pool.set_config(**shard_config(shard))
+            pool.add_connection()
+            if pool_size > 1:
+                threading.Thread(target=_fill_pool, args=(pool, pool_size - 1), name='pool-fill', daemon=True).start()
+            _pools[key] = pool
+    return pool
+
+def _fill_pool(pool, count):
+    for _ in range(count):
+        try:
+            pool.add_connection()
+        except sql.Error as e:
+            print(f"Could not open pooled connection: {e}")
+            return
+
+def get_connection(attempts=3, delay=0.5, shard=None):
+    """
+    Check a healthy connection out of the shard's pool. A connection that
+    fails its ping is reconnected in place; if the pool itself can't hand one
+    out we retry a few times before giving up.
+    """
+    last_error = None
+    for attempt in range(attempts):
+        try:
+            conn = init_pool(shard).get_connection()
+            conn.ping(reconnect=True, attempts=attempts, delay=delay)
+            return conn
+        except sql.Error as e:
+            last_error = e
+            if attempt < attempts - 1:
+                t.sleep(delay)
+    raise last_error
+
+@contextmanager
+def checkout(operation=None, shard=None):
+    """
+    Yield (connection, cursor) from the pool of `shard` (HOME, a store_id, or
+    None for this till's store) and return it afterwards. When an operation
+    name is given, its latency and round trips are recorded.
+    """
+    conn = get_connection(shard=shard)
+    cur = InstrumentedCursor(conn.cursor())
+    started = t.perf_counter()
+    try:
+        yield conn, cur
+    finally:
+        if operation:
+            record_operation(operation, cur.round_trips, (t.perf_counter() - started) * 1000)
+        try:
+            cur.close()
+        except sql.Error:
+            pass
+        conn.close()  # returns the connection to the pool
+
+@contextmanager
+def home_checkout(db_connection, cursor, store_id=None):
+    """The home database for a caller holding a store connection: that same connection when they coincide."""
+    if is_home(store_id):
+        yield db_connection, cursor
+    else:
+        with checkout(shard=HOME) as pair:
+            yield pair
+
+def gather(operation, func, cursor=None):
+    """
+    Scatter func(cursor) over every store's database in parallel and return
+    {store_id: result} for the caller to merge. A single-store setup just
+    uses the cursor it was given.
+    """
+    stores = store_ids()
+    if cursor is not None and len(stores) == 1:
+        return {stores[0]: func(cursor)}
+
+    def run(store_id):
+        with checkout(operation, shard=store_id) as (_, store_cursor):
+            return func(store_cursor)
+    with ThreadPoolExecutor(max_workers=len(stores)) as pool:
+        return dict(zip(stores, pool.map(run, stores)))
+
+def connect_to_database(shard=HOME):
     try:
-        db_host = os.getenv('DB_HOST', 'localhost')
-        db_user = os.getenv('DB_USER', 'root')
-        db_password = os.getenv('DB_PASSWORD', '1401')
-        db_name = os.getenv('DB_NAME', 'project_cs')
-        mydb = sql.connect(host=db_host, user=db_user, password=db_password, database=db_name, charset='utf8')
-        print("Establishing Connection ... ")
-        t.sleep(0.3)
+        mydb = get_connection(shard=shard)
         print(f"Your Connection ID is {mydb.connection_id}")
-        cur = mydb.cursor()
+        cur = InstrumentedCursor(mydb.cursor())
         return mydb, cur
     except sql.Error as e:
         print(f"Error connecting to MySQL: {e}")
@@ -34,6 +375,7 @@ def create_tables(cursor):
     """
     Create tables only if they don't already exist, using the schema you provided.
     This ensures new DBs get the same layout (matching your DESCRIBE output).
+    Runs as schema migration 1; later schema changes go in MIGRATIONS.
     """
     try:
         cursor.execute("""
@@ -92,9 +434,230 @@ def create_tables(cursor):
                 active TINYINT(1) NOT NULL DEFAULT 1
             )
         """)
-        print("Checked/created tables: stock, profits, cust_info, bills, billitems, users.")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS sales_daily (
+                sale_date DATE PRIMARY KEY,
+                bills INT NOT NULL DEFAULT 0,
+                sales DECIMAL(14,2) NOT NULL DEFAULT 0,
+                profit DECIMAL(14,2) NOT NULL DEFAULT 0
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS sales_by_product (
+                p_id INT PRIMARY KEY,
+                quantity BIGINT NOT NULL DEFAULT 0,
+                sales DECIMAL(14,2) NOT NULL DEFAULT 0,
+                profit DECIMAL(14,2) NOT NULL DEFAULT 0,
+                FOREIGN KEY (p_id) REFERENCES stock(p_id)
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id CHAR(32) PRIMARY KEY,
+                user_id INT NOT NULL,
+                expires_at DATETIME NOT NULL,
+                revoked TINYINT(1) NOT NULL DEFAULT 0,
+                FOREIGN KEY (user_id) REFERENCES users(user_id)
+            )
+        """)
+        print("Checked/created tables: stock, profits, cust_info, bills, billitems, users, sales_daily, sales_by_product, sessions.")
     except sql.Error as e:
         print(f"Error creating tables: {e}")
+        raise
+
+# -------------------------
+# Schema migrations
+# -------------------------
+def add_index(cursor, table, name, columns):
+    """Add a secondary index online unless it already exists (safe to re-run)."""
+    cursor.execute("""
+        SELECT 1 FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+        LIMIT 1
+    """, (table, name))
+    if cursor.fetchone():
+        return
+    cursor.execute(f"ALTER TABLE {table} ADD INDEX {name} ({columns}), ALGORITHM=INPLACE, LOCK=NONE")
+
+def add_hot_path_indexes(cursor):
+    add_index(cursor, 'bills', 'idx_bills_date', 'bill_date')
+    add_index(cursor, 'bills', 'idx_bills_cust_date', 'cust_id, bill_date')
+    # covering indexes: receipt lines by bill, and per-product sales
+    add_index(cursor, 'billitems', 'idx_billitems_bill', 'bill_no, p_id, quantity, unit_price, tax_rate, line_total')
+    add_index(cursor, 'billitems', 'idx_billitems_product', 'p_id, bill_no, quantity, unit_price')
+    add_index(cursor, 'stock', 'idx_stock_quantity', 'quantity')
+    add_index(cursor, 'stock', 'idx_stock_supplier', 'supplier, p_id')
+
+def create_journal_applied(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS journal_applied (
+            idem_key CHAR(32) PRIMARY KEY,
+            bill_no INT NOT NULL,
+            applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def create_sales_velocity(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sales_velocity (
+            p_id INT PRIMARY KEY,
+            rate DOUBLE NOT NULL DEFAULT 0,
+            day_qty INT NOT NULL DEFAULT 0,
+            current_day DATE NOT NULL,
+            FOREIGN KEY (p_id) REFERENCES stock(p_id)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS suppliers (
+            name VARCHAR(100) PRIMARY KEY,
+            lead_days INT NOT NULL
+        )
+    """)
+
+def create_archive_tables(cursor):
+    # LIKE copies columns and indexes but not foreign keys, so archived lines
+    # may outlive their products. Columns added to bills/billitems later must
+    # be added here too: archival copies rows with SELECT *.
+    cursor.execute("CREATE TABLE IF NOT EXISTS bills_archive LIKE bills")
+    cursor.execute("CREATE TABLE IF NOT EXISTS billitems_archive LIKE billitems")
+
+# (version, description, apply(cursor)). Append new entries; never edit applied ones.
+MIGRATIONS = [
+    (1, "base tables", create_tables),
+    (2, "hot-path secondary indexes", add_hot_path_indexes),
+    (3, "offline bill journal idempotency keys", create_journal_applied),
+    (4, "per-product sales velocity and supplier lead times", create_sales_velocity),
+    (5, "archive tables for old bills", create_archive_tables),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+SCHEMA_CACHE_FILE = os.getenv('SCHEMA_CACHE_FILE', '.schema_version')
+
+def schema_version(cursor):
+    """Applied schema version, or 0 for a database that predates migrations."""
+    try:
+        cursor.execute("SELECT MAX(version) FROM schema_migrations")
+        row = cursor.fetchone()
+        return row[0] or 0
+    except sql.Error as e:
+        if e.errno == 1146:  # table doesn't exist
+            return 0
+        raise
+
+def schema_cache_key(shard=None):
+    config = shard_config(shard)
+    return f"{config['host']}/{config['database']}/{shard or STORE_ID}:{SCHEMA_VERSION}"
+
+def read_schema_cache():
+    try:
+        with open(SCHEMA_CACHE_FILE, encoding='utf-8') as f:
+            return set(f.read().split())
+    except OSError:
+        return set()
+
+def migrate(cursor, db_connection, use_cache=False, shard=None):
+    """
+    Apply pending migrations to the database of `shard` (HOME, a store_id, or
+    None for this till's store). A current schema costs a single query, so
+    tills don't re-run DDL on every start. With use_cache, a till that already
+    saw this database at SCHEMA_VERSION skips even that (SCHEMA_CACHE_FILE). A
+    named lock keeps tills starting at the same time from migrating concurrently;
+    a till that can't get it within 60 seconds runs no DDL and returns False.
+    """
+    if use_cache and schema_cache_key(shard) in read_schema_cache():
+        return True
+    try:
+        current = schema_version(cursor)
+        if current < SCHEMA_VERSION:
+            cursor.execute("SELECT GET_LOCK('grocery_schema_migration', 60)")
+            locked = cursor.fetchone()
+            if not locked or locked[0] != 1:  # 0: timed out behind another till, NULL: error
+                print("Error migrating schema: could not take the migration lock (another till may still be migrating); try again.")
+                return False
+            try:
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version INT PRIMARY KEY,
+                        description VARCHAR(200) NOT NULL,
+                        applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                current = schema_version(cursor)  # another till may have finished meanwhile
+                for version, description, apply in MIGRATIONS:
+                    if version <= current:
+                        continue
+                    print(f"Applying schema migration {version}: {description}")
+                    apply(cursor)
+                    cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                                   (version, description))
+                    db_connection.commit()
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK('grocery_schema_migration')")
+                cursor.fetchone()
+        if shard != HOME:
+            reserve_bill_range(cursor, STORE_ID if shard is None else int(shard))
+        write_schema_cache(shard)
+        return True
+    except sql.Error as e:
+        print(f"Error migrating schema: {e}")
+        try:
+            db_connection.rollback()
+        except sql.Error:
+            pass
+        return False
+
+def migrate_shards(home_connection, home_cursor, stores=None, use_cache=False):
+    """Migrate the home database, then each store's (default: every store in the shard map)."""
+    if not migrate(home_cursor, home_connection, use_cache, HOME):
+        return False
+    for store_id in store_ids() if stores is None else stores:
+        if is_home(store_id):
+            ok = migrate(home_cursor, home_connection, use_cache, store_id)
+        else:
+            with checkout(shard=store_id) as (db_connection, cursor):
+                ok = migrate(cursor, db_connection, use_cache, store_id)
+        if not ok:
+            return False
+    return True
+
+def reserve_bill_range(cursor, store_id):
+    """Start a store's bill_no auto-increment inside its own range so bills never collide across stores."""
+    base = (store_id - 1) * STORE_ID_SPAN
+    if base <= 0:
+        return
+    # archived bills count too: AUTO_INCREMENT may be lowered to just above the live MAX
+    cursor.execute("""
+        SELECT GREATEST((SELECT COALESCE(MAX(bill_no), 0) FROM bills),
+                        (SELECT COALESCE(MAX(bill_no), 0) FROM bills_archive))
+    """)
+    if cursor.fetchone()[0] < base:
+        cursor.execute(f"ALTER TABLE bills AUTO_INCREMENT = {base + 1}")
+
+def write_schema_cache(shard=None):
+    keys = read_schema_cache()
+    keys.add(schema_cache_key(shard))
+    try:
+        with open(SCHEMA_CACHE_FILE, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(sorted(keys)) + '\n')
+    except OSError:
+        pass
+
+def set_lead_time(cursor, db_connection, args):
+    """Record a supplier's delivery lead time in days."""
+    try:
+        cursor.execute("""
+            INSERT INTO suppliers (name, lead_days) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE lead_days = VALUES(lead_days)
+        """, (args.supplier, args.days))
+        db_connection.commit()
+        print(f"Lead time for {args.supplier}: {args.days} days.")
+    except sql.Error as e:
+        print(f"Error saving lead time: {e}")
+        db_connection.rollback()
+
+def migrate_command(cursor, db_connection, args):
+    """Runs after every store's database (and home) has been migrated."""
+    stores = ', '.join(str(store_id) for store_id in store_ids())
+    print(f"Schema is at version {schema_version(cursor)} (latest {SCHEMA_VERSION}); stores: {stores}.")
 
 # -------------------------
 # Utilities & small helpers
@@ -106,14 +669,142 @@ def to_decimal(value):
 def quantize_money(d: Decimal) -> Decimal:
     return d.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
 
+# -------------------------
+# Password hashing & sessions
+# -------------------------
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+AUTH_WORKERS = int(os.getenv('AUTH_WORKERS', '2'))
+SESSION_TTL_HOURS = int(os.getenv('SESSION_TTL_HOURS', '12'))
+SESSION_FILE = os.getenv('SESSION_FILE', '.till_session')
+SESSION_SECRET_FILE = '.session_secret'
+_auth_pool = None
+
+def _bcrypt_hash(password, rounds):
+    import bcrypt
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+def _bcrypt_check(password, password_hash):
+    import bcrypt
+    return bcrypt.checkpw(password, password_hash)
+
+def auth_pool():
+    """Process pool that keeps bcrypt's CPU cost off the calling thread."""
+    global _auth_pool
+    if _auth_pool is None:
+        from concurrent.futures import ProcessPoolExecutor  # pulls in multiprocessing; only needed at login
+        _auth_pool = ProcessPoolExecutor(max_workers=AUTH_WORKERS)
+    return _auth_pool
+
+def hash_password(password):
+    return auth_pool().submit(_bcrypt_hash, password.encode('utf-8'), BCRYPT_ROUNDS).result()
+
+def verify_password(password, password_hash):
+    return auth_pool().submit(_bcrypt_check, password.encode('utf-8'), bytes(password_hash)).result()
+
+def session_secret():
+    """SESSION_SECRET from the environment, else a per-install secret kept next to the app."""
+    secret = os.getenv('SESSION_SECRET')
+    if secret:
+        return secret.encode('utf-8')
+    if not os.path.exists(SESSION_SECRET_FILE):
+        fd = os.open(SESSION_SECRET_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(secrets.token_hex(32))
+    with open(SESSION_SECRET_FILE, encoding='utf-8') as f:
+        return f.read().strip().encode('utf-8')
+
+def _sign(payload):
+    return hmac.new(session_secret(), payload.encode('utf-8'), hashlib.sha256).hexdigest()
+
+def create_session(cursor, db_connection, user):
+    """Record a session for a logged-in user and return its signed token."""
+    session_id = secrets.token_hex(16)
+    expires = int(t.time()) + SESSION_TTL_HOURS * 3600
+    cursor.execute("INSERT INTO sessions (session_id, user_id, expires_at) VALUES (%s, %s, FROM_UNIXTIME(%s))",
+                   (session_id, user['user_id'], expires))
+    db_connection.commit()
+    payload = f"{session_id}.{user['user_id']}.{expires}"
+    return f"{payload}.{_sign(payload)}"
+
+def verify_session_token(token):
+    """Check a token's signature and expiry locally; returns {'user_id', 'session_id'} or None."""
+    try:
+        session_id, user_id, expires, signature = token.strip().split('.')
+        user_id = int(user_id)
+        expires = int(expires)
+    except ValueError:
+        return None
+    if not hmac.compare_digest(signature, _sign(f"{session_id}.{user_id}.{expires}")):
+        return None
+    if expires < t.time():
+        return None
+    return {"user_id": user_id, "session_id": session_id}
+
+def resume_session(cursor, token):
+    """
+    Return the user for a valid token without a bcrypt round, or None. The
+    signature and expiry are checked locally; one query confirms the session
+    hasn't been revoked and the user is still active.
+    """
+    verified = verify_session_token(token)
+    if verified is None:
+        return None
+    session_id = verified['session_id']
+    user_id = verified['user_id']
+    cursor.execute("""
+        SELECT u.username, u.role, u.active, s.revoked
+        FROM sessions s
+        INNER JOIN users u ON u.user_id = s.user_id
+        WHERE s.session_id = %s AND s.user_id = %s
+    """, (session_id, user_id))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    username, role, active, revoked = row
+    if not active or revoked:
+        return None
+    return {"user_id": user_id, "username": username, "role": role, "session_id": session_id}
+
+def revoke_sessions(cursor, user_id=None, session_id=None):
+    """Revoke one session or every session of a user (caller commits)."""
+    if session_id is not None:
+        cursor.execute("UPDATE sessions SET revoked = 1 WHERE session_id = %s", (session_id,))
+    else:
+        cursor.execute("UPDATE sessions SET revoked = 1 WHERE user_id = %s", (user_id,))
+
+def load_till_session():
+    try:
+        with open(SESSION_FILE, encoding='utf-8') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def save_till_session(token):
+    fd = os.open(SESSION_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(token)
+
+def resume_till_session(cursor):
+    """The user of this till's saved session, or None (a stale token is discarded)."""
+    token = load_till_session()
+    if not token:
+        return None
+    user = resume_session(cursor, token)
+    if user is None:
+        clear_till_session()
+    return user
+
+def clear_till_session():
+    if os.path.exists(SESSION_FILE):
+        os.remove(SESSION_FILE)
+
 # -------------------------
 # Admin & user functions
 # -------------------------
 def ensure_owner_user(cursor, db_connection):
     try:
-        cursor.execute("SELECT COUNT(*) FROM users")
-        count = cursor.fetchone()[0]
-        if count == 0:
+        cursor.execute("SELECT 1 FROM users LIMIT 1")
+        if cursor.fetchone() is None:
             print("No users found. Create an owner account.")
             while True:
                 username = input("Set owner username: ").strip()
@@ -124,7 +815,7 @@ def ensure_owner_user(cursor, db_connection):
                 if len(password) >= 6:
                     break
                 print("Password must be at least 6 characters.")
-            pw_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+            pw_hash = hash_password(password)
             cursor.execute("INSERT INTO users (username, password_hash, role) VALUES (%s, %s, 'owner')", (username, pw_hash))
             db_connection.commit()
             print("Owner account created.")
@@ -146,7 +837,7 @@ def login(cursor):
             if not active:
                 print("Account inactive.")
                 continue
-            if bcrypt.checkpw(password.encode('utf-8'), password_hash):
+            if verify_password(password, password_hash):
                 print(f"Logged in as {username} ({role})")
                 return {"user_id": user_id, "username": username, "role": role}
             else:
@@ -156,6 +847,16 @@ def login(cursor):
             break
     return None
 
+def logout(current_user):
+    """End this till's session so a restart asks for credentials again."""
+    clear_till_session()
+    try:
+        with checkout(shard=HOME) as (db_connection, cursor):
+            revoke_sessions(cursor, session_id=current_user.get('session_id'))
+            db_connection.commit()
+    except sql.Error as e:
+        print(f"Error ending session: {e}")
+
 def require_owner(current_user):
     if not current_user or current_user.get('role') != 'owner':
         print("Access denied. Owner permissions required.")
@@ -165,37 +866,111 @@ def require_owner(current_user):
 # -------------------------
 # Stock / Product functions
 # -------------------------
-def check_stock(cursor):
+REORDER_LEVEL = 10  # reorder point for products with no sales history yet
+# Velocity-driven reordering: a product is due once its stock covers less than
+# its supplier's lead time plus the safety days, and the suggested order
+# brings it up to REORDER_COVER_DAYS of sales past the lead time.
+VELOCITY_ALPHA = float(os.getenv('VELOCITY_ALPHA', '0.13'))  # weight of the latest day (~14-day EWMA)
+VELOCITY_SEED_DAYS = 28
+SUPPLIER_LEAD_DAYS = int(os.getenv('SUPPLIER_LEAD_DAYS', '3'))
+REORDER_SAFETY_DAYS = float(os.getenv('REORDER_SAFETY_DAYS', '2'))
+REORDER_COVER_DAYS = float(os.getenv('REORDER_COVER_DAYS', '14'))
+MIN_ORDER_QTY = int(os.getenv('MIN_ORDER_QTY', str(REORDER_LEVEL)))  # smallest suggested order for a due product
+LISTING_PAGE_SIZE = int(os.getenv('LISTING_PAGE_SIZE', '50'))
+
+def page_through(fetch_page, print_row, page_size):
+    """
+    Keyset pagination: fetch_page(last_key) returns at most page_size rows
+    ordered by their first column, starting after last_key (None = from the
+    start). Only one page is ever held in memory.
+    """
+    last_key = None
+    while True:
+        rows = fetch_page(last_key)
+        for row in rows:
+            print_row(row)
+        if len(rows) < page_size:
+            break
+        last_key = rows[-1][0]
+        if input("-- Enter for next page, q to stop: ").strip().lower() in ('q', 'e', 'exit'):
+            break
+
+def ask_stock_filters():
+    """Prompt for check_stock() filters from the admin menu."""
+    choice = input("Filter (Enter=all, l=low stock, s=supplier): ").strip().lower()
+    if choice == 'l':
+        return {'low_stock_only': True}
+    if choice == 's':
+        return {'supplier': input("Supplier: ").strip()}
+    return {}
+
+def check_stock(cursor, page_size=LISTING_PAGE_SIZE, low_stock_only=False, supplier=None):
     print("Checking Stocks")
-    try:
-        cursor.execute("""
+    filters = []
+    filter_params = []
+    if low_stock_only:
+        filters.append("s.quantity <= %s")
+        filter_params.append(REORDER_LEVEL)
+    if supplier:
+        filters.append("s.supplier = %s")
+        filter_params.append(supplier)
+
+    def fetch_page(last_key):
+        clauses = list(filters)
+        params = list(filter_params)
+        if last_key is not None:
+            clauses.append("s.p_id > %s")
+            params.append(last_key)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        cursor.execute(f"""
             SELECT s.p_id, s.name, s.price, s.quantity, s.brand, s.supplier, p.profit
             FROM stock s
             LEFT JOIN profits p ON s.p_id = p.p_id
+            {where}
             ORDER BY s.p_id
-        """)
-        result = cursor.fetchall()
+            LIMIT %s
+        """, tuple(params + [page_size]))
+        return cursor.fetchall()
+
+    def print_row(rec):
+        p_id, name, price, quantity, brand, supplier, profit = rec
+        print(f"{p_id:<6} {name:<25} {price:<8} {quantity if quantity is not None else 0:<6} {brand or '':<15} {supplier or '':<15} {profit if profit is not None else '':<8}")
+
+    try:
         print(f"{'P_ID':<6} {'Name':<25} {'Price':<8} {'Qty':<6} {'Brand':<15} {'Supplier':<15} {'Profit':<8}")
         print("=" * 90)
-        for rec in result:
-            p_id, name, price, quantity, brand, supplier, profit = rec
-            print(f"{p_id:<6} {name:<25} {price:<8} {quantity if quantity is not None else 0:<6} {brand or '':<15} {supplier or '':<15} {profit if profit is not None else '':<8}")
+        page_through(fetch_page, print_row, page_size)
     except sql.Error as e:
         print(f"Error fetching stock details: {e}")
 
+def allocate_product_ids(cursor, count=1, store_id=None):
+    """
+    First of `count` new consecutive p_ids inside the store's own range, so a
+    p_id names one product across every store. The MAX(p_id) read locks the
+    top of that range until the caller commits its inserts, so concurrent
+    add_item() and import chunks wait for each other instead of taking the same ids.
+    """
+    base = ((STORE_ID if store_id is None else int(store_id)) - 1) * STORE_ID_SPAN
+    cursor.execute("SELECT MAX(p_id) FROM stock WHERE p_id BETWEEN %s AND %s FOR UPDATE",
+                   (base + 1, base + STORE_ID_SPAN))
+    result = cursor.fetchone()
+    first = (result[0] if result and result[0] is not None else base) + 1
+    if first + count - 1 > base + STORE_ID_SPAN:
+        raise ValueError("this store's p_id range is used up")
+    return first
+
 def add_item(cursor, db_connection):
     print("Add Product")
     try:
-        cursor.execute("SELECT MAX(p_id) FROM stock")
-        result = cursor.fetchone()
-        new_p_id = result[0] + 1 if result and result[0] is not None else 1
-        print(f"Generated Product ID: {new_p_id}")
         name = input("Enter product name: ").strip()
         price = int(input("Enter price (integer): "))
         quantity = int(input("Enter quantity: "))
         brand = input("Enter brand: ").strip()
         supplier = input("Enter supplier: ").strip()
         profit = int(input("Enter profit amount (integer): "))
+        # the id is taken only now, so the lock isn't held while someone types
+        new_p_id = allocate_product_ids(cursor)
+        print(f"Generated Product ID: {new_p_id}")
         insert_product_query = """
             INSERT INTO stock (p_id, name, price, quantity, brand, supplier)
             VALUES (%s, %s, %s, %s, %s, %s)
@@ -203,24 +978,371 @@ def add_item(cursor, db_connection):
         cursor.execute(insert_product_query, (new_p_id, name, price, quantity, brand, supplier))
         cursor.execute("INSERT INTO profits (p_id, profit) VALUES (%s, %s)", (new_p_id, profit))
         db_connection.commit()
+        index_product(new_p_id, name, brand, supplier)
         print("Product added successfully with ID:", new_p_id)
     except sql.Error as e:
         print(f"Error adding product: {e}")
+        db_connection.rollback()
     except ValueError as ve:
         print(f"Invalid input: {ve}")
 
+IMPORT_CHUNK_SIZE = 1000
+PRODUCT_TEXT_LIMITS = {'name': 100, 'brand': 100, 'supplier': 100}  # VARCHAR lengths in stock
+INT_RANGE = (-2 ** 31, 2 ** 31 - 1)  # MySQL INT
+
+def read_product_file(path):
+    """
+    Stream (row_no, record) pairs from a .csv or .jsonl product file. A JSONL
+    record is the raw line, decoded by parse_product_record() so one bad line
+    is skipped like any other bad row.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.lower().endswith(('.jsonl', '.ndjson')):
+            for row_no, line in enumerate(f, start=1):
+                if line.strip():
+                    yield row_no, line
+        else:
+            for row_no, record in enumerate(csv.DictReader(f), start=1):
+                yield row_no, record
+
+def product_int(record, field, default=None):
+    value = record.get(field)
+    if value is None or value == '':
+        if default is None:
+            raise ValueError(f"missing {field}")
+        return default
+    number = int(value)
+    if not INT_RANGE[0] <= number <= INT_RANGE[1]:
+        raise ValueError(f"{field} {number} is out of range")
+    return number
+
+def parse_product_record(record):
+    """Return (name, price, quantity, brand, supplier, profit) within the stock columns' limits, or raise ValueError."""
+    if isinstance(record, str):
+        record = json.loads(record)
+    if not isinstance(record, dict):
+        raise ValueError(f"expected an object, got {type(record).__name__}")
+    text = {}
+    for field, limit in PRODUCT_TEXT_LIMITS.items():
+        value = record.get(field)
+        text[field] = '' if value is None else str(value).strip()
+        if len(text[field]) > limit:
+            raise ValueError(f"{field} is longer than {limit} characters")
+    if not text['name']:
+        raise ValueError("missing name")
+    return (text['name'], product_int(record, 'price'), product_int(record, 'quantity', 0),
+            text['brand'], text['supplier'], product_int(record, 'profit', 0))
+
+def load_product_chunk(cursor, db_connection, products, store_id=None):
+    """
+    Insert one chunk of parsed products in a single transaction, with its
+    p_id range taken from allocate_product_ids().
+    """
+    base = allocate_product_ids(cursor, len(products), store_id) - 1
+    stock_rows = []
+    profit_rows = []
+    for offset, (name, price, quantity, brand, supplier, profit) in enumerate(products, start=1):
+        stock_rows.append((base + offset, name, price, quantity, brand, supplier))
+        profit_rows.append((base + offset, profit))
+    cursor.executemany("""
+        INSERT INTO stock (p_id, name, price, quantity, brand, supplier)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """, stock_rows)
+    cursor.executemany("INSERT INTO profits (p_id, profit) VALUES (%s, %s)", profit_rows)
+    db_connection.commit()
+    return base + 1, base + len(products)
+
+def import_products(cursor, db_connection, args):
+    """
+    Bulk-load products from CSV/JSONL (columns: name, price, quantity, brand,
+    supplier, profit) in chunked transactions. Bad rows are reported and
+    skipped; a chunk the server rejects is retried one row at a time so only
+    the offending row is lost. Progress is recorded in <file>.progress after
+    every chunk so --resume continues where a failed run stopped.
+    """
+    progress_path = args.file + '.progress'
+    rows_done = 0
+    if args.resume and os.path.exists(progress_path):
+        with open(progress_path, encoding='utf-8') as f:
+            rows_done = json.load(f)['rows_done']
+        print(f"Resuming after row {rows_done}.")
+    imported = 0
+    skipped = 0
+
+    def load(rows):
+        """Insert (row_no, product) rows in one transaction and add them to the search index."""
+        first_id, last_id = load_product_chunk(cursor, db_connection, [product for _, product in rows], args.store)
+        for p_id, (_, (name, _, _, brand, supplier, _)) in enumerate(rows, start=first_id):
+            index_product(p_id, name, brand, supplier, args.store)
+        return first_id, last_id
+
+    def flush(chunk, last_row):
+        nonlocal imported, skipped
+        try:
+            first_id, last_id = load(chunk)
+            imported += len(chunk)
+            print(f"Rows up to {last_row}: loaded {len(chunk)} products as p_id {first_id}-{last_id}")
+        except (sql.DataError, sql.IntegrityError) as e:
+            db_connection.rollback()
+            print(f"Chunk ending at row {last_row} was rejected ({e}); loading it row by row.")
+            for row_no, product in chunk:
+                try:
+                    load([(row_no, product)])
+                    imported += 1
+                except (sql.DataError, sql.IntegrityError) as e:
+                    db_connection.rollback()
+                    skipped += 1
+                    print(f"Row {row_no} skipped: {e}")
+        with open(progress_path, 'w', encoding='utf-8') as f:
+            json.dump({'rows_done': last_row}, f)
+
+    chunk = []
+    row_no = rows_done
+    try:
+        for row_no, record in read_product_file(args.file):
+            if row_no <= rows_done:
+                continue
+            try:
+                chunk.append((row_no, parse_product_record(record)))
+            except (TypeError, ValueError) as e:
+                skipped += 1
+                print(f"Row {row_no} skipped: {e}")
+            if len(chunk) >= args.chunk_size:
+                flush(chunk, row_no)
+                chunk = []
+        if chunk:
+            flush(chunk, row_no)
+    except (OSError, UnicodeDecodeError, csv.Error) as e:  # before ValueError, which UnicodeDecodeError is
+        print(f"Error reading {args.file} near row {row_no}: {e}")
+        return
+    except (sql.Error, ValueError) as e:
+        db_connection.rollback()
+        print(f"Chunk ending at row {row_no} failed: {e}")
+        print(f"Imported {imported} products before the failure; rerun with --resume to continue.")
+        return
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+    print(f"Import complete: {imported} products loaded, {skipped} rows skipped.")
+
+# -------------------------
+# Product search index
+# -------------------------
+# In-memory token/prefix/trigram index over stock.name, brand and supplier.
+# Only the text fields live here; price and quantity are read live for the
+# handful of matches we display, so stock changes never make the index stale.
+# Each store's catalog gets its own index, keyed by shard_key().
+SEARCH_INDEX_TTL = int(os.getenv('SEARCH_INDEX_TTL', '300'))  # seconds before a full rebuild
+_search_indexes = {}
+_search_index_lock = threading.Lock()    # guards in-place updates against concurrent lookups
+_search_rebuild_lock = threading.Lock()  # one rebuild at a time
+
+def _tokenize(text):
+    return re.findall(r'[a-z0-9]+', (text or '').lower())
+
+def _trigrams(token):
+    padded = f" {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def build_search_index(cursor, store_id=None):
+    """Build a fresh index of the cursor's store and swap it in, so concurrent searches never see a partial one."""
+    index = {'built_at': t.monotonic(), 'docs': {}, 'tokens': {}, 'sorted_tokens': [], 'trigrams': {}}
+    cursor.execute("SELECT p_id, name, brand, supplier FROM stock")
+    for p_id, name, brand, supplier in cursor:
+        _index_into(index, p_id, name, brand, supplier)
+    _search_indexes[shard_key(store_id)] = index
+    return index
+
+def index_product(p_id, name, brand, supplier, store_id=None):
+    """Add or refresh one product in its store's index (no-op until that index is built)."""
+    index = _search_indexes.get(shard_key(store_id))
+    if index is None:
+        return
+    with _search_index_lock:
+        _unindex_from(index, p_id)
+        _index_into(index, p_id, name, brand, supplier)
+
+def unindex_product(p_id, store_id=None):
+    index = _search_indexes.get(shard_key(store_id))
+    if index is None:
+        return
+    with _search_index_lock:
+        _unindex_from(index, p_id)
+
+def _index_into(index, p_id, name, brand, supplier):
+    weights = {}
+    for text, weight in ((name, 2), (brand, 1), (supplier, 1)):  # name matches rank above brand/supplier
+        for token in _tokenize(text):
+            weights[token] = max(weights.get(token, 0), weight)
+    index['docs'][p_id] = weights
+    for token, weight in weights.items():
+        postings = index['tokens'].get(token)
+        if postings is None:
+            postings = index['tokens'][token] = {}
+            bisect.insort(index['sorted_tokens'], token)
+            for tri in _trigrams(token):
+                index['trigrams'].setdefault(tri, set()).add(token)
+        postings[p_id] = weight
+
+def _unindex_from(index, p_id):
+    weights = index['docs'].pop(p_id, None) or {}
+    for token in weights:
+        postings = index['tokens'][token]
+        postings.pop(p_id, None)
+        if postings:
+            continue
+        del index['tokens'][token]
+        sorted_tokens = index['sorted_tokens']
+        del sorted_tokens[bisect.bisect_left(sorted_tokens, token)]
+        for tri in _trigrams(token):
+            index['trigrams'][tri].discard(token)
+
+def search_index_lookup(text, limit=10, store_id=None):
+    """Return up to `limit` (p_id, score) pairs ranked by exact > prefix > trigram matches."""
+    with _search_index_lock:
+        return _lookup(_search_indexes[shard_key(store_id)], text, limit)
+
+def _lookup(index, text, limit):
+    tokens = index['tokens']
+    sorted_tokens = index['sorted_tokens']
+    scores = {}
+    for query in _tokenize(text):
+        best = {}
+        for p_id, weight in tokens.get(query, {}).items():
+            best[p_id] = 3 * weight
+        i = bisect.bisect_left(sorted_tokens, query)
+        while i < len(sorted_tokens) and sorted_tokens[i].startswith(query):
+            if sorted_tokens[i] != query:
+                for p_id, weight in tokens[sorted_tokens[i]].items():
+                    best[p_id] = max(best.get(p_id, 0), 2 * weight)
+            i += 1
+        if len(query) >= 3:
+            # substring / typo matches via shared trigrams
+            query_tris = _trigrams(query)
+            shared = {}
+            for tri in query_tris:
+                for token in index['trigrams'].get(tri, ()):
+                    shared[token] = shared.get(token, 0) + 1
+            for token, count in shared.items():
+                similarity = count / len(query_tris)
+                if similarity < 0.5:
+                    continue
+                for p_id, weight in tokens[token].items():
+                    best[p_id] = max(best.get(p_id, 0), similarity * weight)
+        for p_id, score in best.items():
+            scores[p_id] = scores.get(p_id, 0) + score
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+    return ranked[:limit]
+
+def search_products(cursor, text, limit=10, store_id=None):
+    """Ranked (p_id, name, price, quantity) rows for a free-text search of the cursor's store (store_id)."""
+    key = shard_key(store_id)
+    index = _search_indexes.get(key)
+    if index is None or t.monotonic() - index['built_at'] > SEARCH_INDEX_TTL:
+        with _search_rebuild_lock:
+            if _search_indexes.get(key) is index:  # nobody rebuilt it while we waited
+                build_search_index(cursor, store_id)
+    ranked = search_index_lookup(text, limit, store_id)
+    if not ranked:
+        return []
+    scores = dict(ranked)
+    placeholders = ', '.join(['%s'] * len(scores))
+    cursor.execute(f"SELECT p_id, name, price, quantity FROM stock WHERE p_id IN ({placeholders})",
+                   tuple(scores))
+    rows = cursor.fetchall()
+    rows.sort(key=lambda row: (-scores[row[0]], -(row[3] or 0), row[0]))
+    return rows
+
 # -------------------------
 # Customer functions
 # -------------------------
-def cust_info(cursor):
+# Regulars make up most of the traffic, so customer records are cached by
+# phone and by cust_id. Writes from this process go through the cache; the TTL
+# bounds how long another till's edits can take to show up here.
+CUSTOMER_CACHE_SIZE = int(os.getenv('CUSTOMER_CACHE_SIZE', '5000'))
+CUSTOMER_CACHE_TTL = float(os.getenv('CUSTOMER_CACHE_TTL', '300'))
+_customer_lock = threading.Lock()
+_customers_by_id = OrderedDict()     # cust_id -> (record, cached_at); record is (cust_id, phone_no, name, address)
+_customer_ids_by_phone = {}          # phone_no -> cust_id, for records in _customers_by_id
+
+def _cached_customer(cust_id):
+    entry = _customers_by_id.get(cust_id)
+    if entry is None or t.monotonic() - entry[1] > CUSTOMER_CACHE_TTL:
+        return None
+    _customers_by_id.move_to_end(cust_id)
+    return entry[0]
+
+def cache_customer(record):
+    """Insert or replace one customer record, evicting the least recently used ones."""
+    with _customer_lock:
+        _drop_customer(record[0])
+        _customers_by_id[record[0]] = (record, t.monotonic())
+        _customer_ids_by_phone[record[1]] = record[0]
+        while len(_customers_by_id) > CUSTOMER_CACHE_SIZE:
+            old_id, (old_record, _) = _customers_by_id.popitem(last=False)
+            _customer_ids_by_phone.pop(old_record[1], None)
+            record_cache('customers', 'evictions')
+
+def _drop_customer(cust_id):
+    entry = _customers_by_id.pop(cust_id, None)
+    if entry and _customer_ids_by_phone.get(entry[0][1]) == cust_id:
+        del _customer_ids_by_phone[entry[0][1]]
+
+def invalidate_customer(cust_id):
+    with _customer_lock:
+        _drop_customer(cust_id)
+    record_cache('customers', 'invalidations')
+
+def customer_by_phone(cursor, phone):
+    """(cust_id, phone_no, name, address) for a phone number, or None."""
+    with _customer_lock:
+        cust_id = _customer_ids_by_phone.get(phone)
+        record = _cached_customer(cust_id) if cust_id is not None else None
+    if record is not None and record[1] == phone:
+        record_cache('customers', 'hits')
+        return record
+    record_cache('customers', 'misses')
+    cursor.execute("SELECT cust_id, phone_no, name, address FROM cust_info WHERE phone_no = %s", (phone,))
+    record = cursor.fetchone()
+    if record:
+        cache_customer(tuple(record))
+    return record
+
+def customer_by_id(cursor, cust_id):
+    """(cust_id, phone_no, name, address) for a customer ID, or None."""
+    with _customer_lock:
+        record = _cached_customer(cust_id)
+    if record is not None:
+        record_cache('customers', 'hits')
+        return record
+    record_cache('customers', 'misses')
+    cursor.execute("SELECT cust_id, phone_no, name, address FROM cust_info WHERE cust_id = %s", (cust_id,))
+    record = cursor.fetchone()
+    if record:
+        cache_customer(tuple(record))
+    return record
+
+def cust_info(cursor, page_size=LISTING_PAGE_SIZE):
     print("Checking Customer Details")
+
+    def fetch_page(last_key):
+        if last_key is None:
+            cursor.execute("SELECT cust_id, phone_no, name, address FROM cust_info ORDER BY cust_id LIMIT %s",
+                           (page_size,))
+        else:
+            cursor.execute("""
+                SELECT cust_id, phone_no, name, address FROM cust_info
+                WHERE cust_id > %s ORDER BY cust_id LIMIT %s
+            """, (last_key, page_size))
+        return cursor.fetchall()
+
+    def print_row(rec):
+        cust_id, phone_no, name, address = rec
+        print(f"{cust_id:<8} {phone_no:<15} {name:<30} {address or '':<40}")
+
     try:
-        cursor.execute("SELECT cust_id, phone_no, name, address FROM cust_info ORDER BY cust_id")
-        result = cursor.fetchall()
         print(f"{'Cust_ID':<8} {'Phone_No':<15} {'Name':<30} {'Address':<40}")
         print("=" * 100)
-        for cust_id, phone_no, name, address in result:
-            print(f"{cust_id:<8} {phone_no:<15} {name:<30} {address or '':<40}")
+        page_through(fetch_page, print_row, page_size)
     except sql.Error as e:
         print(f"Error fetching customer details: {e}")
 
@@ -237,16 +1359,14 @@ def cust_update(cursor, db_connection):
         cust_id = None
         if identifier.isdigit() and len(identifier) == 10:
             phone = identifier
-            cursor.execute("SELECT cust_id FROM cust_info WHERE phone_no = %s", (phone,))
-            row = cursor.fetchone()
+            row = customer_by_phone(cursor, phone)
             if not row:
                 print("Phone number not found.")
                 continue
             cust_id = row[0]
         elif identifier.isdigit():
             cust_id = int(identifier)
-            cursor.execute("SELECT 1 FROM cust_info WHERE cust_id = %s", (cust_id,))
-            if cursor.fetchone() is None:
+            if customer_by_id(cursor, cust_id) is None:
                 print("Customer ID not found.")
                 continue
         else:
@@ -274,6 +1394,8 @@ def cust_update(cursor, db_connection):
                 print("Phone updated.")
         except sql.Error as e:
             print(f"Error updating customer information: {e}")
+        finally:
+            invalidate_customer(cust_id)
 
 # -------------------------
 # Stock reorder & profits
@@ -283,84 +1405,529 @@ def simulate_auto_call(supplier):
     t.sleep(1)
     print("Automated call completed.")
 
+def simulated_supplier_order(supplier, products):
+    """Default supplier adapter: places the call, leaves restock confirmation to the admin."""
+    simulate_auto_call(supplier)
+    return None
+
+# Supplier adapters take (supplier, [(p_id, name, quantity), ...]) and place one
+# order for all of them. They may return {p_id: restocked_quantity} to confirm
+# deliveries directly; None means the admin is asked for each product.
+SUPPLIER_ADAPTERS = {
+    'simulated': simulated_supplier_order,
+}
+SUPPLIER_CALL_WORKERS = int(os.getenv('SUPPLIER_CALL_WORKERS', '8'))
+
+def dispatch_supplier_orders(orders, adapter_name=None):
+    """Send one order per supplier concurrently; returns {supplier: adapter result}."""
+    adapter = SUPPLIER_ADAPTERS[adapter_name or os.getenv('SUPPLIER_ADAPTER', 'simulated')]
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(SUPPLIER_CALL_WORKERS, len(orders)))) as pool:
+        futures = {pool.submit(adapter, supplier, products): supplier for supplier, products in orders.items()}
+        for future in as_completed(futures):
+            supplier = futures[future]
+            try:
+                results[supplier] = future.result()
+            except Exception as e:
+                print(f"Order to {supplier or 'unknown supplier'} failed: {e}")
+                results[supplier] = None
+    return results
+
+def ask_restock(p_id, name):
+    """Ask the admin about one product; returns ('set', qty) or ('add', qty)."""
+    while True:
+        restocked = input(f"Has product {p_id} ({name}) been restocked? (yes/no): ").strip().lower()
+        if restocked == 'no':
+            print("Admin will need to manually update the stock.")
+            manual_update = input("Enter the new quantity of the product (0 if not restocked): ").strip()
+            try:
+                new_quantity = int(manual_update)
+                if new_quantity >= 0:
+                    return 'set', new_quantity
+                print("Quantity must be >= 0.")
+            except ValueError:
+                print("Invalid number.")
+        elif restocked == 'yes':
+            restocked_quantity = input("Enter the quantity restocked: ").strip()
+            try:
+                restocked_quantity = int(restocked_quantity)
+                if restocked_quantity > 0:
+                    return 'add', restocked_quantity
+                print("Restocked quantity must be > 0.")
+            except ValueError:
+                print("Invalid number.")
+        else:
+            print("Please answer 'yes' or 'no'.")
+
+def reorder_candidates(cursor, today=None):
+    """
+    Products due for reordering as (p_id, name, quantity, supplier, per_day,
+    days_of_cover, suggested) rows. A product is due once its stock covers no
+    more than its supplier's lead time plus REORDER_SAFETY_DAYS at its current
+    velocity; products with no sales history fall back to REORDER_LEVEL and
+    are topped up to it. Every due product gets at least MIN_ORDER_QTY.
+    One pass over stock; billitems is never read.
+    """
+    cursor.execute("""
+        SELECT s.p_id, s.name, s.quantity, s.supplier, v.rate, v.day_qty, v.current_day, sp.lead_days
+        FROM stock s
+        LEFT JOIN sales_velocity v ON v.p_id = s.p_id
+        LEFT JOIN suppliers sp ON sp.name = s.supplier
+        ORDER BY s.p_id
+    """)
+    due = []
+    for p_id, name, quantity, supplier, rate, day_qty, current_day, lead_days in cursor:
+        quantity = quantity or 0
+        lead_days = SUPPLIER_LEAD_DAYS if lead_days is None else lead_days
+        per_day = current_velocity(rate, day_qty, current_day, today)
+        if rate is None:
+            threshold = target = REORDER_LEVEL
+        else:
+            threshold = math.ceil(per_day * (lead_days + REORDER_SAFETY_DAYS))
+            target = math.ceil(per_day * (lead_days + REORDER_COVER_DAYS))
+        if quantity > threshold:
+            continue
+        days_of_cover = quantity / per_day if per_day > 0 else None
+        suggested = max(MIN_ORDER_QTY, target - quantity)
+        due.append((p_id, name, quantity, supplier or '', per_day, days_of_cover, suggested))
+    return due
+
 def check_reorder(cursor, db_connection):
     try:
         print("Checking reorder levels...")
-        cursor.execute("""
-            SELECT s.p_id, s.name, s.quantity, s.supplier, COALESCE(p.profit, 0)
-            FROM stock s
-            LEFT JOIN profits p ON s.p_id = p.p_id
-            ORDER BY s.p_id
-        """)
-        result = cursor.fetchall()
-        products_to_reorder = [(p_id, name, quantity or 0, supplier or '') for p_id, name, quantity, supplier, _ in result if (quantity or 0) <= 10]
-        if not products_to_reorder:
-            print("All products are above reorder level.")
+        due = reorder_candidates(cursor)
+        if not due:
+            print("All products have enough stock to cover their supplier lead time.")
             return
-        print(f"{'P_ID':<6} {'Name':<25} {'Quantity':<8} {'Supplier':<20}")
-        print("="*60)
-        for p_id, name, quantity, supplier in products_to_reorder:
-            print(f"{p_id:<6} {name:<25} {quantity:<8} {supplier:<20}")
-            simulate_auto_call(supplier)
-            while True:
-                restocked = input("Have the items been restocked? (yes/no): ").strip().lower()
-                if restocked == 'no':
-                    print("Admin will need to manually update the stock.")
-                    manual_update = input("Enter the new quantity of the product (0 if not restocked): ").strip()
-                    try:
-                        new_quantity = int(manual_update)
-                        if new_quantity >= 0:
-                            cursor.execute("UPDATE stock SET quantity = %s WHERE p_id = %s", (new_quantity, p_id))
-                            db_connection.commit()
-                            print(f"Stock updated for Product ID {p_id}. New quantity: {new_quantity}")
-                            break
-                        else:
-                            print("Quantity must be >= 0.")
-                    except ValueError:
-                        print("Invalid number.")
-                elif restocked == 'yes':
-                    restocked_quantity = input("Enter the quantity restocked: ").strip()
-                    try:
-                        restocked_quantity = int(restocked_quantity)
-                        if restocked_quantity > 0:
-                            cursor.execute("SELECT quantity FROM stock WHERE p_id = %s", (p_id,))
-                            cur_qty = cursor.fetchone()[0] or 0
-                            new_quantity = cur_qty + restocked_quantity
-                            cursor.execute("UPDATE stock SET quantity = %s WHERE p_id = %s", (new_quantity, p_id))
-                            db_connection.commit()
-                            print(f"Stock updated for Product ID {p_id}. New quantity: {new_quantity}")
-                            break
-                        else:
-                            print("Restocked quantity must be > 0.")
-                    except ValueError:
-                        print("Invalid number.")
-                else:
-                    print("Please answer 'yes' or 'no'.")
+        orders = {}
+        print(f"{'P_ID':<6} {'Name':<25} {'Quantity':<8} {'Per day':>8} {'Cover':>7} {'Suggest':>8} {'Supplier':<20}")
+        print("="*90)
+        for p_id, name, quantity, supplier, per_day, days_of_cover, suggested in due:
+            orders.setdefault(supplier, []).append((p_id, name, quantity))
+            cover = f"{days_of_cover:.1f}d" if days_of_cover is not None else '-'
+            print(f"{p_id:<6} {name:<25} {quantity:<8} {per_day:>8.1f} {cover:>7} {suggested:>8} {supplier:<20}")
+        print(f"Placing {len(orders)} supplier orders...")
+        confirmations = dispatch_supplier_orders(orders)
+
+        set_quantities = {}
+        add_quantities = {}
+        for supplier, products in orders.items():
+            confirmed = confirmations.get(supplier) or {}
+            for p_id, name, _ in products:
+                if p_id in confirmed:
+                    add_quantities[p_id] = confirmed[p_id]
+                    continue
+                action, amount = ask_restock(p_id, name)
+                (set_quantities if action == 'set' else add_quantities)[p_id] = amount
+        restock_products(cursor, set_quantities, add_quantities)
+        db_connection.commit()
+        print(f"Stock updated for {len(set_quantities) + len(add_quantities)} products.")
     except sql.Error as e:
         print(f"Error checking reorder levels: {e}")
+        db_connection.rollback()
+
+def record_sales_summary(cursor, bill_date, items, bills=1):
+    """
+    Fold `bills` bills (all dated bill_date, `items` being all of their lines)
+    into sales_daily and sales_by_product. Called inside the bills' transaction
+    so the summary commits (or rolls back) with them.
+    Profit is the per-unit amount from the profits table times quantity.
+    """
+    sales = sum((item['unit_price'] * Decimal(item['quantity']) for item in items), Decimal('0.00'))
+    profit = sum((item['profit'] for item in items), Decimal('0.00'))
+    cursor.execute("""
+        INSERT INTO sales_daily (sale_date, bills, sales, profit) VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE bills = bills + VALUES(bills), sales = sales + VALUES(sales), profit = profit + VALUES(profit)
+    """, (bill_date, bills, str(sales), str(profit)))
+    per_product = {}
+    for item in items:
+        qty, line_sales, line_profit = per_product.get(item['p_id'], (0, Decimal('0.00'), Decimal('0.00')))
+        per_product[item['p_id']] = (qty + item['quantity'],
+                                     line_sales + item['unit_price'] * Decimal(item['quantity']),
+                                     line_profit + item['profit'])
+    if per_product:
+        cursor.executemany("""
+            INSERT INTO sales_by_product (p_id, quantity, sales, profit) VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity),
+                sales = sales + VALUES(sales), profit = profit + VALUES(profit)
+        """, [(p_id, qty, str(line_sales), str(line_profit))
+              for p_id, (qty, line_sales, line_profit) in per_product.items()])
+        record_sales_velocity(cursor, bill_date, {p_id: qty for p_id, (qty, _, _) in per_product.items()})
+
+def record_sales_velocity(cursor, bill_date, quantities):
+    """
+    Fold units sold on bill_date into each product's velocity. Units pile up in
+    day_qty until a sale on a later day closes the day: rate takes day_qty
+    with weight VELOCITY_ALPHA and decays once more for every day with no sales.
+    Sales dated before current_day (replayed offline bills) count towards it.
+    """
+    # alpha is inlined so the VALUES list holds only placeholders and the
+    # connector can send all rows as one multi-row INSERT
+    alpha = float(VELOCITY_ALPHA)
+    cursor.executemany(f"""
+        INSERT INTO sales_velocity (p_id, rate, day_qty, current_day) VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            rate = IF(VALUES(current_day) <= current_day, rate,
+                      ({alpha} * day_qty + {1 - alpha} * rate)
+                      * POW({1 - alpha}, DATEDIFF(VALUES(current_day), current_day) - 1)),
+            day_qty = IF(VALUES(current_day) <= current_day, day_qty + VALUES(day_qty), VALUES(day_qty)),
+            current_day = GREATEST(current_day, VALUES(current_day))
+    """, [(p_id, 0, qty, bill_date) for p_id, qty in quantities.items()])
+
+def current_velocity(rate, day_qty, current_day, today=None):
+    """Units/day as of today from a sales_velocity row (0 for products never sold)."""
+    if rate is None:
+        return 0.0
+    today = today or date.today()
+    if current_day >= today:
+        # today's sales so far can only raise the estimate; the day isn't over
+        return max(rate, VELOCITY_ALPHA * day_qty + (1 - VELOCITY_ALPHA) * rate)
+    closed = VELOCITY_ALPHA * day_qty + (1 - VELOCITY_ALPHA) * rate
+    return closed * (1 - VELOCITY_ALPHA) ** ((today - current_day).days - 1)
+
+def backfill_sales_summary(cursor, db_connection, args=None):
+    """Rebuild sales_daily and sales_by_product from the full bill history. Run while tills are idle."""
+    print("Rebuilding sales summary from bill history...")
+    try:
+        cursor.execute("DELETE FROM sales_daily")
+        cursor.execute("DELETE FROM sales_by_product")
+        # a day can be split between live and archived bills, so lines are grouped after the union
+        cursor.execute(f"""
+            INSERT INTO sales_daily (sale_date, bills, sales, profit)
+            SELECT bill_date, COUNT(DISTINCT bill_no), COALESCE(SUM(sales), 0), COALESCE(SUM(profit), 0)
+            FROM ({hot_and_cold(BILL_LINES)}) l
+            GROUP BY bill_date
+        """)
+        days = cursor.rowcount
+        cursor.execute(f"""
+            INSERT INTO sales_by_product (p_id, quantity, sales, profit)
+            SELECT p_id, SUM(quantity), SUM(sales), SUM(profit)
+            FROM ({hot_and_cold(BILL_LINES)}) l
+            WHERE p_id IS NOT NULL
+            GROUP BY p_id
+        """)
+        products = cursor.rowcount
+        # seed velocity with the plain average over the last VELOCITY_SEED_DAYS
+        cursor.execute("DELETE FROM sales_velocity")
+        cursor.execute("""
+            INSERT INTO sales_velocity (p_id, rate, day_qty, current_day)
+            SELECT bi.p_id, SUM(bi.quantity) / %s, 0, %s
+            FROM bills b
+            INNER JOIN billitems bi ON bi.bill_no = b.bill_no
+            WHERE b.bill_date > %s AND b.bill_date < %s
+            GROUP BY bi.p_id
+        """, (VELOCITY_SEED_DAYS, date.today() - timedelta(days=1),
+              date.today() - timedelta(days=VELOCITY_SEED_DAYS + 1), date.today()))
+        db_connection.commit()
+        print(f"Sales summary rebuilt: {days} days, {products} products.")
+    except sql.Error as e:
+        print(f"Error rebuilding sales summary: {e}")
+        db_connection.rollback()
+
+def store_profit_totals(cursor):
+    """(total sales, total profit, today's (bills, sales, profit) or None) for one store."""
+    cursor.execute("SELECT SUM(sales), SUM(profit) FROM sales_daily")
+    total_sales, total_profits = cursor.fetchone() or (None, None)
+    cursor.execute("SELECT bills, sales, profit FROM sales_daily WHERE sale_date = %s", (date.today(),))
+    return total_sales or 0, total_profits or 0, cursor.fetchone()
 
 def check_total_profits(cursor):
     print("Checking Total Profits")
     try:
-        cursor.execute("""
-            SELECT
-                SUM(bi.quantity * bi.unit_price) AS total_sales,
-                SUM((bi.unit_price - COALESCE(s.price,0)) * bi.quantity) AS total_profit
-            FROM billitems bi
-            INNER JOIN stock s ON s.p_id = bi.p_id
-        """)
-        result = cursor.fetchone()
-        if result:
-            total_sales, total_profits = result
-            total_sales = total_sales or 0
-            total_profits = total_profits or 0
-            print(f"Total Sales Amount: {total_sales}")
-            print(f"Total Profits Amount: {total_profits}")
-        else:
-            print("No profit data available.")
+        per_store = gather('store_profit_totals', store_profit_totals, cursor)
+        if len(per_store) > 1:
+            for store_id, (sales, profit, today) in per_store.items():
+                print(f"Store {store_id}: sales {sales}, profit {profit}"
+                      + (f" (today: {today[0]} bills, {today[1]})" if today else ""))
+        total_sales = sum(sales for sales, _, _ in per_store.values())
+        total_profits = sum(profit for _, profit, _ in per_store.values())
+        print(f"Total Sales Amount: {total_sales}")
+        print(f"Total Profits Amount: {total_profits}")
+        today = [row for _, _, row in per_store.values() if row]
+        if today:
+            print(f"Today: {sum(row[0] for row in today)} bills, sales {sum(row[1] for row in today)}, "
+                  f"profit {sum(row[2] for row in today)}")
     except sql.Error as e:
         print(f"Error fetching total profits: {e}")
 
+# -------------------------
+# Archive: cold bills
+# -------------------------
+# Bills older than ARCHIVE_AFTER_DAYS move, with their lines, into
+# bills_archive/billitems_archive so the live tables (and the buffer pool)
+# hold only recent sales. sales_daily and sales_by_product already cover
+# both; queries over bill history read hot_and_cold() of a template.
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '365'))
+ARCHIVE_BATCH = int(os.getenv('ARCHIVE_BATCH', '500'))       # bills per transaction
+ARCHIVE_PAUSE = float(os.getenv('ARCHIVE_PAUSE', '0.5'))     # seconds between batches
+ARCHIVE_TABLES = ('bills_archive', 'billitems_archive')
+
+# Every bill line with its date, sales and profit; bills without lines keep one row of NULLs.
+BILL_LINES = """
+    SELECT b.bill_no, b.bill_date, bi.p_id, bi.quantity, bi.quantity * bi.unit_price AS sales,
+           bi.quantity * COALESCE(p.profit, 0) AS profit
+    FROM {bills} b
+    LEFT JOIN {billitems} bi ON bi.bill_no = b.bill_no
+    LEFT JOIN profits p ON p.p_id = bi.p_id
+    WHERE b.bill_date IS NOT NULL
+"""
+
+def hot_and_cold(template):
+    """A query template over {bills}/{billitems}, for the live tables UNION ALL the archive (params repeat)."""
+    hot = template.format(bills='bills', billitems='billitems')
+    cold = template.format(bills=ARCHIVE_TABLES[0], billitems=ARCHIVE_TABLES[1])
+    return f"{hot}\n    UNION ALL\n{cold}"
+
+def archive_bills(cursor, db_connection, args):
+    """
+    Move bills older than args.days into the archive tables, args.batch bills
+    per short transaction with a pause in between, so tills billing meanwhile
+    never queue behind the job. Safe to stop and rerun.
+    """
+    if args.days <= VELOCITY_SEED_DAYS:
+        print(f"Keep at least {VELOCITY_SEED_DAYS + 1} days of bills live; sales velocity is seeded from them.")
+        return
+    cutoff = date.today() - timedelta(days=args.days)
+    started = t.monotonic()
+    moved = 0
+    lines = 0
+    try:
+        while True:
+            cursor.execute("""
+                SELECT bill_no FROM bills
+                WHERE bill_date < %s
+                ORDER BY bill_date, bill_no
+                LIMIT %s
+            """, (cutoff, args.batch))
+            bill_nos = tuple(row[0] for row in cursor.fetchall())
+            if not bill_nos:
+                break
+            placeholders = ', '.join(['%s'] * len(bill_nos))
+            cursor.execute(f"INSERT IGNORE INTO bills_archive SELECT * FROM bills WHERE bill_no IN ({placeholders})",
+                           bill_nos)
+            cursor.execute(f"""
+                INSERT IGNORE INTO billitems_archive SELECT * FROM billitems WHERE bill_no IN ({placeholders})
+            """, bill_nos)
+            lines += cursor.rowcount
+            cursor.execute(f"DELETE FROM billitems WHERE bill_no IN ({placeholders})", bill_nos)
+            cursor.execute(f"DELETE FROM bills WHERE bill_no IN ({placeholders})", bill_nos)
+            db_connection.commit()
+            moved += len(bill_nos)
+            print(f"  {moved} bills archived", end='\r')
+            t.sleep(args.pause)
+    except sql.Error as e:
+        db_connection.rollback()
+        print(f"\nArchiving stopped after {moved} bills: {e}. Rerun to continue.")
+        return
+    print(f"\nArchived {moved} bills ({lines} lines) dated before {cutoff} in {t.monotonic() - started:.1f}s.")
+
+# -------------------------
+# Sales reports
+# -------------------------
+# Per-product totals are grouped on the server (bills by idx_bills_date, lines
+# through the covering idx_billitems_bill) and streamed into a heap, so memory
+# stays at N rows however many products sold. All-time reports and series read
+# the sales summary tables instead.
+REPORT_TOP_N = 10
+REPORT_METRICS = {'1': 'sales', '2': 'quantity', '3': 'profit'}
+
+RANGE_TOTALS = """
+    SELECT bi.p_id, SUM(bi.quantity) AS quantity, SUM(bi.quantity * bi.unit_price) AS sales
+    FROM {bills} b
+    INNER JOIN {billitems} bi ON bi.bill_no = b.bill_no
+    WHERE b.bill_date BETWEEN %s AND %s
+    GROUP BY bi.p_id
+"""
+PRODUCT_TOTALS_RANGE = RANGE_TOTALS.format(bills='bills', billitems='billitems')
+# Each half is grouped on its own index first, so the outer sum only sees
+# at most two rows per product rather than every line in the range.
+PRODUCT_TOTALS_HOT_AND_COLD = f"""
+    SELECT p_id, SUM(quantity) AS quantity, SUM(sales) AS sales
+    FROM ({hot_and_cold(RANGE_TOTALS)}) halves
+    GROUP BY p_id
+"""
+
+def archive_horizon(cursor):
+    """Date of the newest archived bill, or None when nothing is archived (one index probe)."""
+    cursor.execute(f"SELECT MAX(bill_date) FROM {ARCHIVE_TABLES[0]}")
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def product_totals_source(cursor, start=None, end=None):
+    """(derived table SQL, params) of per-product p_id, quantity, sales for the range."""
+    if start is None and end is None:
+        return "SELECT p_id, quantity, sales FROM sales_by_product", ()
+    bounds = (start or date.min, end or date.max)
+    if start is not None:
+        horizon = archive_horizon(cursor)
+        if horizon is None or start > horizon:
+            return PRODUCT_TOTALS_RANGE, bounds
+    return PRODUCT_TOTALS_HOT_AND_COLD, bounds + bounds
+
+def product_names(cursor, keys):
+    """
+    {(store_id, p_id): (name, quantity)}, each looked up in the store the
+    product belongs to. The cursor is used for a single-store setup.
+    """
+    wanted = {}
+    for store_id, p_id in keys:
+        wanted.setdefault(store_id, []).append(p_id)
+
+    def lookup(store_cursor, p_ids):
+        placeholders = ', '.join(['%s'] * len(p_ids))
+        store_cursor.execute(f"SELECT p_id, name, quantity FROM stock WHERE p_id IN ({placeholders})", tuple(p_ids))
+        return store_cursor.fetchall()
+    names = {}
+    for store_id, p_ids in wanted.items():
+        if len(store_ids()) == 1:
+            rows = lookup(cursor, p_ids)
+        else:
+            with checkout('product_names', shard=store_id) as (_, store_cursor):
+                rows = lookup(store_cursor, p_ids)
+        for p_id, name, quantity in rows:
+            names[(store_id, p_id)] = (name, quantity)
+    return names
+
+def query_product_totals(cursor, start=None, end=None):
+    """Run the per-product (p_id, quantity, sales, profit) query; iterate the cursor for the rows."""
+    source, params = product_totals_source(cursor, start, end)
+    cursor.execute(f"""
+        SELECT g.p_id, g.quantity, g.sales, g.quantity * COALESCE(p.profit, 0)
+        FROM ({source}) g
+        LEFT JOIN profits p ON p.p_id = g.p_id
+    """, params)
+    return cursor
+
+def top_products(cursor, metric='sales', n=REPORT_TOP_N, start=None, end=None):
+    """
+    The n best sellers by 'sales', 'quantity' or 'profit' as (store_id, p_id,
+    quantity, sales, profit) rows. Every store has its own catalog, so a
+    product is a (store_id, p_id) pair: stores that predate per-store p_id
+    ranges can reuse each other's p_ids for unrelated products.
+    """
+    column = {'quantity': 2, 'sales': 3, 'profit': 4}[metric]
+    key = lambda row: (row[column] or 0, -row[0], -row[1])
+    if len(store_ids()) == 1:
+        return heapq.nlargest(n, ((store_ids()[0], *row) for row in query_product_totals(cursor, start, end)),
+                              key=key)
+    # one query per store in parallel; each store's products then compete for the overall top n
+    per_store = gather('top_products', lambda store_cursor: query_product_totals(store_cursor, start, end).fetchall())
+    return heapq.nlargest(n, ((store_id, *row) for store_id, rows in per_store.items() for row in rows), key=key)
+
+def slow_movers(cursor, n=REPORT_TOP_N, start=None, end=None):
+    """
+    The n products that sold the fewest units in the range, including ones
+    that didn't sell at all, as (p_id, quantity_sold, stock_on_hand) rows.
+    Ties go to the product with the most stock sitting on the shelf. This is
+    about one store's shelves, so it only looks at the cursor's store.
+    """
+    source, params = product_totals_source(cursor, start, end)
+    cursor.execute(f"""
+        SELECT s.p_id, COALESCE(g.quantity, 0), COALESCE(s.quantity, 0)
+        FROM stock s
+        LEFT JOIN ({source}) g ON g.p_id = s.p_id
+    """, params)
+    return heapq.nsmallest(n, cursor, key=lambda row: (row[1], -row[2], row[0]))
+
+def sales_series(cursor, start, end, weekly=False):
+    """Daily (or ISO-week) (period, bills, sales, profit) rows from sales_daily, summed over every store."""
+    def store_days(store_cursor):
+        store_cursor.execute("""
+            SELECT sale_date, bills, sales, profit FROM sales_daily
+            WHERE sale_date BETWEEN %s AND %s ORDER BY sale_date
+        """, (start, end))
+        return store_cursor.fetchall()
+    per_store = gather('sales_series', store_days, cursor)
+    if len(per_store) == 1:
+        days = next(iter(per_store.values()))
+    else:
+        merged = {}
+        for rows in per_store.values():
+            for sale_date, bills, sales, profit in rows:
+                total = merged.setdefault(sale_date, [0, 0, 0])
+                total[0] += bills
+                total[1] += sales
+                total[2] += profit
+        days = [(sale_date, *merged[sale_date]) for sale_date in sorted(merged)]
+    if not weekly:
+        return days
+    weeks = []
+    for sale_date, bills, sales, profit in days:
+        year, week, _ = sale_date.isocalendar()
+        label = f"{year}-W{week:02d}"
+        if weeks and weeks[-1][0] == label:
+            _, week_bills, week_sales, week_profit = weeks[-1]
+            weeks[-1] = (label, week_bills + bills, week_sales + sales, week_profit + profit)
+        else:
+            weeks.append((label, bills, sales, profit))
+    return weeks
+
+def ask_date_range(default_days=None):
+    """Prompt for a YYYY-MM-DD range; blank start means all time (or the last default_days days)."""
+    start = input("From date (YYYY-MM-DD, blank = " + ("all time" if default_days is None
+                  else f"last {default_days} days") + "): ").strip()
+    end = input("To date (YYYY-MM-DD, blank = today): ").strip()
+    end = date.fromisoformat(end) if end else None
+    if start:
+        start = date.fromisoformat(start)
+    elif default_days is not None:
+        start = (end or date.today()) - timedelta(days=default_days - 1)
+    else:
+        start = None
+    if end is None and start is not None:
+        end = date.today()
+    return start, end  # (None, None) = all time, answered from the summary tables
+
+def sales_reports(cursor):
+    while True:
+        print("\nSales Reports")
+        print("1. Top products")
+        print("2. Slow movers")
+        print("3. Daily sales")
+        print("4. Weekly sales")
+        print("e. Back")
+        choice = input("Enter your choice: ").strip()
+        if choice.lower() in ('e', 'exit'):
+            break
+        if choice not in ('1', '2', '3', '4'):
+            print("Invalid choice.")
+            continue
+        try:
+            if choice in ('1', '2'):
+                start, end = ask_date_range()
+                n = int(input(f"How many products? [{REPORT_TOP_N}]: ").strip() or REPORT_TOP_N)
+            else:
+                start, end = ask_date_range(default_days=30 if choice == '3' else 182)
+        except ValueError as ve:
+            print(f"Invalid input: {ve}")
+            continue
+        try:
+            started = t.perf_counter()
+            if choice == '1':
+                metric = REPORT_METRICS.get(input("Rank by (1 revenue, 2 quantity, 3 profit) [1]: ").strip() or '1',
+                                            'sales')
+                started = t.perf_counter()
+                rows = top_products(cursor, metric, n, start, end)
+                names = product_names(cursor, [row[:2] for row in rows])
+                print(f"{'Store':<6} {'P_ID':<10} {'Name':<30} {'Qty':>10} {'Revenue':>14} {'Profit':>14}")
+                for store_id, p_id, quantity, sales, profit in rows:
+                    name = names.get((store_id, p_id), ('?', 0))[0]
+                    print(f"{store_id:<6} {p_id:<10} {name:<30} {quantity:>10} {sales:>14} {profit:>14}")
+            elif choice == '2':
+                rows = slow_movers(cursor, n, start, end)
+                names = product_names(cursor, [(STORE_ID, row[0]) for row in rows])
+                print(f"{'P_ID':<10} {'Name':<30} {'Sold':>10} {'On hand':>10}")
+                for p_id, sold, on_hand in rows:
+                    print(f"{p_id:<10} {names.get((STORE_ID, p_id), ('?', 0))[0]:<30} {sold:>10} {on_hand:>10}")
+            else:
+                rows = sales_series(cursor, start, end, weekly=choice == '4')
+                print(f"{'Period':<12} {'Bills':>8} {'Sales':>14} {'Profit':>14}")
+                for period, bills, sales, profit in rows:
+                    print(f"{str(period):<12} {bills:>8} {sales:>14} {profit:>14}")
+            print(f"{len(rows)} rows in {(t.perf_counter() - started) * 1000:.1f} ms")
+        except sql.Error as e:
+            print(f"Error running report: {e}")
+
 # -------------------------
 # User management
 # -------------------------
@@ -378,7 +1945,7 @@ def manage_users(cursor, db_connection):
                 print("Invalid role.")
                 continue
             password = input("Password: ").strip()
-            pw_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+            pw_hash = hash_password(password)
             try:
                 cursor.execute("INSERT INTO users (username, password_hash, role) VALUES (%s, %s, %s)", (username, pw_hash, role))
                 db_connection.commit()
@@ -388,23 +1955,428 @@ def manage_users(cursor, db_connection):
         elif choice == '2':
             username = input("Username to disable: ").strip()
             try:
-                cursor.execute("UPDATE users SET active = 0 WHERE username = %s", (username,))
+                cursor.execute("SELECT user_id FROM users WHERE username = %s", (username,))
+                row = cursor.fetchone()
+                if row is None:
+                    print("User not found.")
+                    continue
+                cursor.execute("UPDATE users SET active = 0 WHERE user_id = %s", (row[0],))
+                revoke_sessions(cursor, user_id=row[0])
                 db_connection.commit()
-                print("User disabled.")
+                write_offline_credentials(cursor)  # other tills drop them at their next refresh
+                print("User disabled and signed out of all tills.")
             except sql.Error as e:
                 print(f"Error disabling user: {e}")
+            except OSError as e:
+                print(f"User disabled, but offline credentials could not be updated: {e}")
         elif choice.lower() in ('e','exit'):
             break
         else:
             print("Invalid choice.")
 
+# -------------------------
+# Receipts
+# -------------------------
+# Receipts go into the segmented store in receipt_store.py (RECEIPT_DIR),
+# written by a background thread so checkout never waits on the disk.
+RECEIPT_DIR = receipt_store.RECEIPT_DIR
+RECEIPT_BATCH_SIZE = 50
+_receipt_queue = None
+_receipt_thread = None
+_receipts = None
+
+def receipts():
+    """This process's receipt store, opened on first use."""
+    global _receipts
+    if _receipts is None:
+        _receipts = receipt_store.ReceiptStore(RECEIPT_DIR)
+    return _receipts
+
+def render_receipt(invoice_no, bill_date, cust_name, phone, items, total_price, gst_amount):
+    """Receipt text; items are (p_id, name, qty, price, tax_rate, line_total) tuples."""
+    lines = [
+        "GROCERY SHOP RECEIPT",
+        f"Invoice: {invoice_no}",
+        f"Date: {bill_date}",
+        f"Customer: {cust_name}  Phone: {phone}",
+        "",
+        "Items:",
+        f"{'P_ID':<8}{'Name':<25}{'Qty':<6}{'Price':<10}{'Tax%':<6}{'Line':<10}",
+    ]
+    line_sum = Decimal('0.00')
+    for p_id, name, qty, price, tax_rate, line_total in items:
+        lines.append(f"{p_id:<8}{name:<25}{qty:<6}{price:<10}{tax_rate:<6}{line_total:<10}")
+        line_sum += Decimal(line_total)
+    lines.append("")
+    # total_price is the subtotal as stored in bills (int); GST and grand total are exact.
+    lines.append(f"Subtotal (stored int): {total_price}")
+    lines.append(f"GST: {gst_amount}")
+    lines.append(f"Grand Total: {quantize_money(line_sum + gst_amount)}")
+    return "\n".join(lines) + "\n"
+
+def _receipt_writer_loop(pending):
+    store = receipts()
+    running = True
+    while running:
+        batch = [pending.get()]
+        while len(batch) < RECEIPT_BATCH_SIZE:
+            try:
+                batch.append(pending.get_nowait())
+            except queue.Empty:
+                break
+        for entry in batch:
+            if entry is None:
+                running = False
+                continue
+            invoice_no, text, bill_date = entry
+            try:
+                store.append(invoice_no, text, bill_date)
+            except OSError as e:
+                print(f"Error writing receipt {invoice_no}: {e}")
+        for _ in batch:
+            pending.task_done()
+
+def start_receipt_writer():
+    global _receipt_queue, _receipt_thread
+    if _receipt_thread is None or not _receipt_thread.is_alive():
+        _receipt_queue = queue.Queue()
+        _receipt_thread = threading.Thread(target=_receipt_writer_loop, args=(_receipt_queue,),
+                                           name='receipt-writer', daemon=True)
+        _receipt_thread.start()
+
+def stop_receipt_writer():
+    """Flush queued receipts, stop the writer thread and close the open segment."""
+    global _receipt_thread
+    if _receipt_thread is not None and _receipt_thread.is_alive():
+        _receipt_queue.put(None)
+        _receipt_thread.join()
+    _receipt_thread = None
+    if _receipts is not None:
+        _receipts.close()
+
+atexit.register(stop_receipt_writer)
+
+def queue_receipt(invoice_no, text, bill_date=None):
+    """Hand a rendered receipt to the background writer; returns the invoice number it is stored under."""
+    start_receipt_writer()
+    _receipt_queue.put((invoice_no, text, bill_date))
+    return invoice_no
+
+def print_receipt(cursor, bill_id, invoice_no=None, gst_amount=None):
+    """
+    Re-render a stored bill from the database, print it and add it to the
+    receipt store if the store doesn't have it yet. Archived bills are found in the archive tables. The
+    invoice number and GST are worked out from the bill when not given.
+    Returns the receipt text.
+    """
+    try:
+        for bills, billitems in (('bills', 'billitems'), ARCHIVE_TABLES):
+            cursor.execute(f"""
+                SELECT b.bill_no, b.bill_date, b.total_price, c.name, c.phone_no, c.address
+                FROM {bills} b
+                LEFT JOIN cust_info c ON c.cust_id = b.cust_id
+                WHERE b.bill_no = %s
+            """, (bill_id,))
+            bill = cursor.fetchone()
+            if bill:
+                break
+        else:
+            print(f"No bill {bill_id} found.")
+            return None
+        cursor.execute(f"""
+            SELECT bi.p_id, COALESCE(s.name, '(deleted product)'), bi.quantity, bi.unit_price,
+                   bi.tax_rate, bi.line_total
+            FROM {billitems} bi LEFT JOIN stock s ON s.p_id = bi.p_id
+            WHERE bi.bill_no = %s
+        """, (bill_id,))
+        items = cursor.fetchall()
+        if invoice_no is None:
+            invoice_no = f"INV-{(bill[1] or date.today()).year}-{bill_id:06d}"
+        if gst_amount is None:
+            gst_amount = quantize_money(sum((Decimal(price) * qty * Decimal(tax_rate) / Decimal('100')
+                                             for _, _, qty, price, tax_rate, _ in items), Decimal('0.00')))
+        text = render_receipt(invoice_no, bill[1], bill[3], bill[4], items, bill[2], gst_amount)
+        if receipts().lookup(invoice_no) is None:
+            receipts().append(invoice_no, text, bill[1])
+        print(text, end='')
+        return text
+    except Exception as e:
+        print(f"Error printing receipt: {e}")
+
+def reprint_command(cursor, db_connection, args):
+    """
+    Reprint by invoice number straight from the receipt store; a plain bill
+    number, or an invoice the store doesn't have, is re-rendered from the
+    database of the store the bill number belongs to.
+    """
+    try:
+        bill_no = int(args.bill.strip().rsplit('-', 1)[-1])
+    except ValueError:
+        print(f"Not a bill or invoice number: {args.bill}")
+        return
+    invoice_no = args.bill.strip().upper() if args.bill.strip().upper().startswith('INV-') else None
+    text = receipts().read(invoice_no) if invoice_no else None
+    if text is not None:
+        print(text, end='')
+        return
+    store_id = store_for_bill(bill_no)
+    if store_id != (args.store or STORE_ID) and store_id in store_ids():
+        with checkout('reprint', shard=store_id) as (_, store_cursor):
+            print_receipt(store_cursor, bill_no, invoice_no)
+    else:
+        print_receipt(cursor, bill_no, invoice_no)
+
 # -------------------------
 # Billing
 # -------------------------
+# tax_rate default (because stock doesn't have tax_rate column)
+DEFAULT_TAX_RATE = Decimal('18.00')
+RESERVE_ATTEMPTS = 3  # re-price and retry when another till takes the stock mid-checkout
+
+def price_lines(catalog, lines):
+    """
+    Price cart lines against catalog {p_id: (name, price, quantity, profit)}.
+    `lines` is a list of (p_id, quantity) in scan order. Returns (items, rejected):
+    items are dicts ready for billitems, rejected are (p_id, quantity, reason).
+    Stock is checked cumulatively, so scanning the same product twice can't oversell it.
+    """
+    available = {p_id: (row[2] or 0) for p_id, row in catalog.items()}
+    items = []
+    rejected = []
+    for p_id, quantity in lines:
+        if p_id not in catalog:
+            rejected.append((p_id, quantity, "Product not found."))
+            continue
+        if quantity > available[p_id]:
+            rejected.append((p_id, quantity, f"Insufficient stock ({available[p_id]} left)."))
+            continue
+        available[p_id] -= quantity
+        name, price_db, _, profit_db = catalog[p_id]
+        unit_price = to_decimal(price_db)  # stock.price is int; convert to Decimal
+        line_subtotal = unit_price * Decimal(quantity)
+        # profit from profits table (profit stored as integer)
+        profit_amount = Decimal(profit_db) if profit_db is not None else Decimal('0')
+        items.append({
+            'p_id': p_id,
+            'name': name,
+            'quantity': quantity,
+            'unit_price': unit_price,
+            'tax_rate': DEFAULT_TAX_RATE,
+            'line_total': quantize_money(line_subtotal),  # line_total is written without tax
+            'profit': profit_amount * Decimal(quantity),
+        })
+    return items, rejected
+
+def price_cart(cursor, lines):
+    """Price the cart's products with one joined stock+profits query (a plain read, no row locks)."""
+    if not lines:
+        return [], []
+    p_ids = sorted({p_id for p_id, _ in lines})
+    placeholders = ', '.join(['%s'] * len(p_ids))
+    cursor.execute(f"""
+        SELECT s.p_id, s.name, s.price, s.quantity, p.profit
+        FROM stock s
+        LEFT JOIN profits p ON s.p_id = p.p_id
+        WHERE s.p_id IN ({placeholders})
+    """, tuple(p_ids))
+    catalog = {row[0]: row[1:] for row in cursor.fetchall()}
+    return price_lines(catalog, lines)
+
+def cart_totals(items):
+    """Subtotal, GST, grand total, the INT bills.total_price and profit for priced items."""
+    final_p = sum((item['unit_price'] * Decimal(item['quantity']) for item in items), Decimal('0.00'))
+    total_profit = sum((item['profit'] for item in items), Decimal('0.00'))
+    # compute GST (sum of line_subtotals * tax_rate)
+    total_gst = Decimal('0.00')
+    for item in items:
+        line_subtotal = item['unit_price'] * Decimal(item['quantity'])
+        total_gst += (line_subtotal * (item['tax_rate'] / Decimal('100')))
+    gst = quantize_money(total_gst)
+    # bills.total_price column is INT in your DB schema. We'll store subtotal as INT (rounded).
+    # Keep a record of the float/decimal totals in billitems and receipts.
+    return {
+        'subtotal': final_p,
+        'total_price': int(final_p.to_integral_value(rounding=ROUND_HALF_UP)),
+        'gst': gst,
+        'grand_total': quantize_money(final_p + gst),
+        'profit': total_profit,
+    }
+
+def decrement_stock(cursor, items, clamp=False, conditional=False):
+    """
+    Apply the items' stock decrements with one set-based UPDATE. With
+    `conditional`, a product is only decremented while it still has enough
+    stock; returns False when any product fell short (nothing is undone here).
+    """
+    decrements = {}
+    for item in items:
+        decrements[item['p_id']] = decrements.get(item['p_id'], 0) + item['quantity']
+    if not decrements:
+        return True
+    cases = ' '.join(['WHEN %s THEN %s'] * len(decrements))
+    placeholders = ', '.join(['%s'] * len(decrements))
+    params = [value for pair in decrements.items() for value in pair] + list(decrements)
+    new_quantity = f"quantity - CASE p_id {cases} END"
+    if clamp:
+        new_quantity = f"GREATEST(COALESCE(quantity, 0) - CASE p_id {cases} END, 0)"
+    condition = ''
+    if conditional:
+        condition = f"AND quantity >= CASE p_id {cases} END"
+        params += [value for pair in decrements.items() for value in pair]
+    cursor.execute(f"""
+        UPDATE stock SET quantity = {new_quantity}
+        WHERE p_id IN ({placeholders}) {condition}
+    """, tuple(params))
+    return not conditional or cursor.rowcount == len(decrements)
+
+def restock_products(cursor, set_quantities, add_quantities):
+    """
+    Apply restocks with one set-based UPDATE: products in set_quantities get
+    that quantity, products in add_quantities get it added to their stock.
+    """
+    if not set_quantities and not add_quantities:
+        return
+    parts = []
+    params = []
+    if set_quantities:
+        parts.append(f"CASE p_id {' '.join(['WHEN %s THEN %s'] * len(set_quantities))} END")
+        params += [value for pair in set_quantities.items() for value in pair]
+    if add_quantities:
+        parts.append(f"COALESCE(quantity, 0) + CASE p_id {' '.join(['WHEN %s THEN %s'] * len(add_quantities))} END")
+        params += [value for pair in add_quantities.items() for value in pair]
+    new_quantity = parts[0] if len(parts) == 1 else f"COALESCE({parts[0]}, {parts[1]})"
+    p_ids = list(set_quantities) + [p_id for p_id in add_quantities if p_id not in set_quantities]
+    cursor.execute(f"""
+        UPDATE stock SET quantity = {new_quantity}
+        WHERE p_id IN ({', '.join(['%s'] * len(p_ids))})
+    """, tuple(params + p_ids))
+
+def insert_billitems(cursor, bill_items):
+    """bill_items is a list of (bill_no, item) pairs, written with one multi-row insert."""
+    if bill_items:
+        cursor.executemany("""
+            INSERT INTO billitems (bill_no, p_id, quantity, unit_price, tax_rate, line_total)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, [(bill_no, item['p_id'], item['quantity'], str(item['unit_price']),
+               str(item['tax_rate']), str(item['line_total'])) for bill_no, item in bill_items])
+
+def finalize_cart(cursor, db_connection, cust_id, lines):
+    """
+    Price the cart and write the bill in one short transaction: one pricing
+    query, one set-based stock decrement, the bills insert and a single
+    multi-row billitems insert. Returns a dict describing the committed bill.
+    When no line can be billed nothing is written: bill_no is None and
+    `rejected` says why.
+
+    Pricing takes no locks. The conditional decrement is the first statement
+    that locks stock rows, so they are held only until the commit a few
+    statements later. If another till sold the stock in between, the cart is
+    re-read and re-priced, and the lines that no longer fit are rejected.
+    """
+    started = t.perf_counter()
+    trips_before = getattr(cursor, 'round_trips', 0)
+    for attempt in range(1, RESERVE_ATTEMPTS + 1):
+        if db_connection.in_transaction:
+            db_connection.rollback()  # only read snapshots can be open while the cart is built
+        db_connection.start_transaction()
+        items, rejected = price_cart(cursor, lines)
+        if decrement_stock(cursor, items, conditional=True):
+            break
+        if attempt == RESERVE_ATTEMPTS:
+            # give up without writing anything, so "try again" can't leave a bill behind
+            db_connection.rollback()
+            rejected += [(item['p_id'], item['quantity'], "Stock changed during checkout; try again.")
+                         for item in items]
+            return {'bill_no': None, 'invoice_no': None, 'cust_id': cust_id, 'items': [],
+                    'rejected': rejected, 'attempts': attempt}
+    if not items:
+        db_connection.rollback()
+        return {'bill_no': None, 'invoice_no': None, 'cust_id': cust_id, 'items': [],
+                'rejected': rejected, 'attempts': attempt}
+    totals = cart_totals(items)
+
+    bill_date = date.today()
+    cursor.execute("INSERT INTO bills (cust_id, bill_date, total_price) VALUES (%s, %s, %s)",
+                   (cust_id, bill_date, totals['total_price']))
+    bill_id = cursor.lastrowid
+    insert_billitems(cursor, [(bill_id, item) for item in items])
+
+    record_sales_summary(cursor, bill_date, items)
+    db_connection.commit()
+    record_operation('finalize_cart', getattr(cursor, 'round_trips', 0) - trips_before,
+                     (t.perf_counter() - started) * 1000)
+    return dict(totals, **{
+        'bill_no': bill_id,
+        'invoice_no': f"INV-{bill_date.year}-{bill_id:06d}",
+        'cust_id': cust_id,
+        'bill_date': bill_date,
+        'items': items,
+        'rejected': rejected,
+        'attempts': attempt,
+    })
+
+def add_customer(cursor, db_connection, phone, name, address):
+    """Insert a customer on the home database; returns the full record."""
+    cursor.execute("INSERT INTO cust_info (phone_no, name, address) VALUES (%s, %s, %s)", (phone, name, address))
+    db_connection.commit()
+    record = (cursor.lastrowid, phone, name, address)
+    cache_customer(record)
+    return record
+
+def replicate_customers(cursor, records):
+    """
+    Copy home customer records into a store database so its bills can reference them.
+    A phone number that moved to another customer at home is first taken off the
+    replica row still holding it (parked as '~<cust_id>', never a valid phone), so
+    the upsert doesn't trip UNIQUE phone_no; that row gets its own number back when
+    it is next replicated.
+    """
+    if records:
+        cursor.executemany(
+            "UPDATE cust_info SET phone_no = CONCAT('~', cust_id) WHERE phone_no = %s AND cust_id <> %s",
+            [(record[1], record[0]) for record in records])
+        cursor.executemany("""
+            INSERT INTO cust_info (cust_id, phone_no, name, address) VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE phone_no = VALUES(phone_no), name = VALUES(name), address = VALUES(address)
+        """, [tuple(record) for record in records])
+
+def queue_bill_receipt(result, cust_name, phone):
+    receipt_items = [(item['p_id'], item['name'], item['quantity'], item['unit_price'],
+                      item['tax_rate'], item['line_total']) for item in result['items']]
+    return queue_receipt(result['invoice_no'], render_receipt(
+        result['invoice_no'], result['bill_date'], cust_name, phone,
+        receipt_items, result['total_price'], result['gst']), result['bill_date'])
+
+def checkout_cart(cursor, db_connection, phone, lines, name='', address='', store_id=None):
+    """
+    Headless checkout used by the service and scripts: look up or create the
+    customer, finalize the cart on the given store's connection and queue its
+    receipt. Raises ValueError for bad input and sql.Error for database failures.
+    """
+    if len(phone) != 10 or not phone.isdigit():
+        raise ValueError("phone must be exactly 10 digits")
+    lines = [(int(p_id), int(quantity)) for p_id, quantity in lines]
+    if any(quantity <= 0 for _, quantity in lines):
+        raise ValueError("quantities must be > 0")
+    with home_checkout(db_connection, cursor, store_id) as (home_connection, home_cursor):
+        customer = customer_by_phone(home_cursor, phone)
+        if customer is None:
+            if not name:
+                raise ValueError("name is required for a new customer")
+            customer = add_customer(home_cursor, home_connection, phone, name, address)
+    if not is_home(store_id):
+        replicate_customers(cursor, [customer])
+        db_connection.commit()
+    cust_id, cust_name = customer[0], customer[2]
+    result = finalize_cart(cursor, db_connection, cust_id, lines)
+    result['cust_name'] = cust_name
+    if result['items']:
+        result['receipt'] = queue_bill_receipt(result, cust_name, phone)
+    return result
+
 def bill(cursor, db_connection):
     print("Making Bills")
     try:
-        db_connection.start_transaction()
         # Get or create customer
         while True:
             phone = input("Enter Phone no. of Customer: ").strip()
@@ -412,23 +2384,22 @@ def bill(cursor, db_connection):
                 print("Number should be exactly 10 digits.")
             else:
                 break
-        cursor.execute("SELECT cust_id, name FROM cust_info WHERE phone_no = %s", (phone,))
-        result = cursor.fetchone()
-        if result:
-            cust_id, cust_name = result
-            print(f"Welcome back, {cust_name}!")
-        else:
-            name = input("Enter Name of Customer: ").strip()
-            address = input("Enter Address of Customer: ").strip()
-            cursor.execute("INSERT INTO cust_info (phone_no, name, address) VALUES (%s, %s, %s)", (phone, name, address))
+        with home_checkout(db_connection, cursor) as (home_connection, home_cursor):
+            customer = customer_by_phone(home_cursor, phone)
+            if customer:
+                print(f"Welcome back, {customer[2]}!")
+            else:
+                name = input("Enter Name of Customer: ").strip()
+                address = input("Enter Address of Customer: ").strip()
+                customer = add_customer(home_cursor, home_connection, phone, name, address)
+                print("Customer Information Added")
+        if not is_home():
+            replicate_customers(cursor, [customer])
             db_connection.commit()
-            cust_id = cursor.lastrowid
-            print("Customer Information Added")
-
-        final_p = Decimal('0.00')         # subtotal (sum of unit * qty)
-        total_profit = Decimal('0.00')
-        items_added = []
+        cust_id, cust_name = customer[0], customer[2]
 
+        # Lines are only collected here; they are priced and checked against stock at finalize.
+        lines = []
         while True:
             prod_id = input("Enter product ID or search text (e=finalize): ").strip()
             if prod_id.lower() in ('e', 'exit'):
@@ -439,45 +2410,12 @@ def bill(cursor, db_connection):
                 if quantity <= 0:
                     print("Quantity must be > 0.")
                     continue
-                select_query = "SELECT price, quantity FROM stock WHERE p_id = %s FOR UPDATE"
-                cursor.execute(select_query, (p_id,))
-                row = cursor.fetchone()
-                if not row:
-                    print("Product not found.")
-                    continue
-                price_db, stock_qty = row
-                if stock_qty is None:
-                    stock_qty = 0
-                if quantity > stock_qty:
-                    print("Insufficient stock.")
-                    continue
-                unit_price = to_decimal(price_db)  # stock.price is int; convert to Decimal
-                line_subtotal = unit_price * Decimal(quantity)
-                # profit from profits table (profit stored as integer)
-                cursor.execute("SELECT profit FROM profits WHERE p_id = %s", (p_id,))
-                prof_row = cursor.fetchone()
-                profit_amount = Decimal(prof_row[0]) if prof_row and prof_row[0] is not None else Decimal('0')
-                item_profit = profit_amount * Decimal(quantity)
-                final_p += line_subtotal
-                total_profit += item_profit
-                # Update stock quantity
-                new_quantity = stock_qty - quantity
-                cursor.execute("UPDATE stock SET quantity = %s WHERE p_id = %s", (new_quantity, p_id))
-                # tax_rate default (because stock doesn't have tax_rate column)
-                line_tax_rate = Decimal('18.00')
-                line_total = quantize_money(line_subtotal)  # we write line_total without tax (consistent with previous approach)
-                items_added.append((p_id, quantity, unit_price, line_tax_rate, line_total))
-                print(f"Added {quantity} x product {p_id} -> line total {line_total}")
+                lines.append((p_id, quantity))
+                print(f"Added {quantity} x product {p_id}")
             else:
-                # search by name
-                q = f"%{prod_id}%"
+                # search by name, brand or supplier
                 try:
-                    cursor.execute("""
-                        SELECT p_id, name, price, quantity FROM stock
-                        WHERE name LIKE %s
-                        ORDER BY quantity DESC LIMIT 10
-                    """, (q,))
-                    rows = cursor.fetchall()
+                    rows = search_products(cursor, prod_id)
                     if not rows:
                         print("No matching items.")
                     else:
@@ -487,42 +2425,25 @@ def bill(cursor, db_connection):
                 except sql.Error as e:
                     print(f"Search error: {e}")
 
-        # compute GST (sum of line_subtotals * tax_rate)
-        total_gst = Decimal('0.00')
-        for _, qty, unit_price, tax_rate, _ in items_added:
-            line_subtotal = unit_price * Decimal(qty)
-            total_gst += (line_subtotal * (tax_rate / Decimal('100')))
-
-        gst = quantize_money(total_gst)
-        grand_total = quantize_money(final_p + gst)
-
-        # bills.total_price column is INT in your DB schema. We'll store subtotal as INT (rounded).
-        # Keep a record of the float/decimal totals in billitems and receipts.
-        bill_total_for_db = int(final_p.to_integral_value(rounding=ROUND_HALF_UP))
-
-        insert_bill_query = "INSERT INTO bills (cust_id, bill_date, total_price) VALUES (%s, %s, %s)"
-        bill_date = date.today()
-        cursor.execute(insert_bill_query, (cust_id, bill_date, bill_total_for_db))
-        bill_id = cursor.lastrowid
-
-        for p_id, qty, unit_price, tax_rate, line_total in items_added:
-            cursor.execute("""
-                INSERT INTO billitems (bill_no, p_id, quantity, unit_price, tax_rate, line_total)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (bill_id, p_id, qty, str(unit_price), str(tax_rate), str(line_total)))
-
-        db_connection.commit()
+        result = finalize_cart(cursor, db_connection, cust_id, lines)
+        for p_id, quantity, reason in result['rejected']:
+            print(f"Skipped {quantity} x product {p_id}: {reason}")
+        if not result['items']:
+            print("Nothing could be billed; no bill was created.")
+            return
+        for item in result['items']:
+            print(f"{item['quantity']} x product {item['p_id']} -> line total {item['line_total']}")
 
-        invoice_no = f"INV-{bill_date.year}-{bill_id:06d}"
-        print_receipt(cursor, bill_id, invoice_no, gst)
+        queue_bill_receipt(result, cust_name, phone)
+        print(f"Receipt queued to {RECEIPT_DIR}/")
         print("\n--- Bill Summary ---")
-        print(f'Bill ID: {bill_id}')
-        print(f'Invoice No: {invoice_no}')
+        print(f"Bill ID: {result['bill_no']}")
+        print(f"Invoice No: {result['invoice_no']}")
         print(f'Customer ID: {cust_id}')
-        print(f'Total Before GST: {quantize_money(final_p)}')
-        print(f'Applied GST: {gst}')
-        print(f'Total After GST: {grand_total}')
-        print(f'Bill Date: {bill_date}')
+        print(f"Total Before GST: {quantize_money(result['subtotal'])}")
+        print(f"Applied GST: {result['gst']}")
+        print(f"Total After GST: {result['grand_total']}")
+        print(f"Bill Date: {result['bill_date']}")
 
     except sql.Error as e:
         print(f"Error processing bill: {e}")
@@ -533,52 +2454,376 @@ def bill(cursor, db_connection):
     except ValueError as ve:
         print(f"Invalid input: {ve}")
 
-def print_receipt(cursor, bill_id, invoice_no, gst_amount):
+# -------------------------
+# Offline mode: catalog snapshot & bill journal
+# -------------------------
+CATALOG_SNAPSHOT = os.getenv('CATALOG_SNAPSHOT', 'catalog_snapshot.json')
+# bcrypt hashes of the active users who have logged in on this till, signed
+# with the session secret, so a till that logged out cleanly can still sign
+# them in while MySQL is down. Disabled users drop out at the next refresh.
+OFFLINE_CREDENTIALS = os.getenv('OFFLINE_CREDENTIALS', 'offline_users.json')
+BILL_JOURNAL = os.getenv('BILL_JOURNAL', 'bill_journal.jsonl')
+# held by the offline till writing the journal and by replay, never both at once
+JOURNAL_LOCK = BILL_JOURNAL + '.lock'
+JOURNAL_FSYNC_EVERY = int(os.getenv('JOURNAL_FSYNC_EVERY', '10'))        # entries per fsync
+JOURNAL_FSYNC_SECONDS = float(os.getenv('JOURNAL_FSYNC_SECONDS', '1.0'))  # max age of an unsynced entry
+JOURNAL_REPLAY_BATCH = 500
+_journal = None
+_journal_lock = threading.Lock()
+
+def write_catalog_snapshot(cursor):
+    """Stream stock+profits into the local snapshot offline tills price from."""
+    tmp_path = CATALOG_SNAPSHOT + '.tmp'
+    count = 0
+    cursor.execute("""
+        SELECT s.p_id, s.name, s.price, s.quantity, p.profit
+        FROM stock s
+        LEFT JOIN profits p ON s.p_id = p.p_id
+    """)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write('{"created": ' + json.dumps(t.strftime('%Y-%m-%d %H:%M:%S')) + ', "products": {')
+        for p_id, name, price, quantity, profit in cursor:
+            f.write(("," if count else "") + json.dumps(str(p_id)) + ": " + json.dumps([name, price, quantity, profit]))
+            count += 1
+        f.write("}}")
+    os.replace(tmp_path, CATALOG_SNAPSHOT)
+    return count
+
+def write_offline_credentials(cursor, user_id=None):
+    """
+    Save the password hashes for offline login of the users already saved on
+    this till plus user_id (who just logged in), dropping any that have been
+    disabled since; returns how many.
+    """
+    user_ids = {saved[0] for saved in load_offline_credentials().values()}
+    if user_id is not None:
+        user_ids.add(user_id)
+    users = []
+    if user_ids:
+        placeholders = ', '.join(['%s'] * len(user_ids))
+        cursor.execute(f"""
+            SELECT user_id, username, role, password_hash FROM users
+            WHERE active = 1 AND user_id IN ({placeholders})
+        """, tuple(sorted(user_ids)))
+        users = [[user_id, username, role, bytes(password_hash).decode('ascii')]
+                 for user_id, username, role, password_hash in cursor.fetchall()]
+    payload = json.dumps(users, sort_keys=True)
+    tmp_path = OFFLINE_CREDENTIALS + '.tmp'
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump({'users': payload, 'signature': _sign(payload)}, f)
+    os.replace(tmp_path, OFFLINE_CREDENTIALS)
+    return len(users)
+
+def load_offline_credentials():
+    """{username: (user_id, role, password_hash)}; empty when the file is missing or was tampered with."""
     try:
-        cursor.execute("""
-            SELECT b.bill_no, b.bill_date, b.total_price, c.name, c.phone_no, c.address
-            FROM bills b
-            INNER JOIN cust_info c ON c.cust_id = b.cust_id
-            WHERE b.bill_no = %s
-        """, (bill_id,))
-        bill = cursor.fetchone()
-        cursor.execute("""
-            SELECT bi.p_id, s.name, bi.quantity, bi.unit_price, bi.tax_rate, bi.line_total
-            FROM billitems bi INNER JOIN stock s ON s.p_id = bi.p_id
-            WHERE bi.bill_no = %s
-        """, (bill_id,))
-        items = cursor.fetchall()
-        os.makedirs('receipts', exist_ok=True)
-        file_path = os.path.join('receipts', f'{invoice_no}.txt')
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write("GROCERY SHOP RECEIPT\n")
-            f.write(f"Invoice: {invoice_no}\n")
-            f.write(f"Date: {bill[1]}\n")
-            f.write(f"Customer: {bill[3]}  Phone: {bill[4]}\n")
-            f.write("\nItems:\n")
-            f.write(f"{'P_ID':<8}{'Name':<25}{'Qty':<6}{'Price':<10}{'Tax%':<6}{'Line':<10}\n")
-            for p_id, name, qty, price, tax_rate, line_total in items:
-                f.write(f"{p_id:<8}{name:<25}{qty:<6}{price:<10}{tax_rate:<6}{line_total:<10}\n")
-            f.write("\n")
-            # bill[2] is total_price as stored (int). We'll show computed GST and grand total using gst_amount.
-            f.write(f"Subtotal (stored int): {bill[2]}\n")
-            f.write(f"GST: {gst_amount}\n")
-            # compute grand total for receipt
-            # gather subtotal from billitems for exact display:
-            cursor.execute("SELECT SUM(line_total) FROM billitems WHERE bill_no = %s", (bill_id,))
-            line_sum = cursor.fetchone()[0] or Decimal('0.00')
-            grand_total = quantize_money(Decimal(line_sum) + gst_amount)
-            f.write(f"Grand Total: {grand_total}\n")
-        print(f"Receipt saved to {file_path}")
-    except Exception as e:
-        print(f"Error printing receipt: {e}")
+        with open(OFFLINE_CREDENTIALS, encoding='utf-8') as f:
+            saved = json.load(f)
+        if not hmac.compare_digest(saved['signature'], _sign(saved['users'])):
+            return {}
+        return {username: (user_id, role, password_hash.encode('ascii'))
+                for user_id, username, role, password_hash in json.loads(saved['users'])}
+    except (OSError, ValueError, KeyError):
+        return {}
+
+def refresh_catalog_snapshot_async(user_id=None):
+    """Refresh the snapshot and offline credentials on pooled connections without delaying the menu."""
+    def refresh():
+        try:
+            with checkout('snapshot_catalog') as (db_connection, cursor):
+                write_catalog_snapshot(cursor)
+            with checkout(shard=HOME) as (db_connection, cursor):
+                write_offline_credentials(cursor, user_id)
+        except (sql.Error, OSError) as e:
+            print(f"Catalog snapshot failed: {e}")
+    threading.Thread(target=refresh, name='catalog-snapshot', daemon=True).start()
+
+def snapshot_catalog_command(cursor, db_connection, args):
+    print(f"Catalog snapshot written: {write_catalog_snapshot(cursor)} products.")
+    with home_checkout(db_connection, cursor) as (_, home_cursor):
+        print(f"Offline credentials written: {write_offline_credentials(home_cursor)} users.")
+
+def load_catalog_snapshot():
+    with open(CATALOG_SNAPSHOT, encoding='utf-8') as f:
+        snapshot = json.load(f)
+    return snapshot['created'], {int(p_id): tuple(row) for p_id, row in snapshot['products'].items()}
+
+def _journal_sync_loop():
+    while True:
+        t.sleep(JOURNAL_FSYNC_SECONDS)
+        with _journal_lock:
+            if _journal is None:
+                return
+            if _journal['unsynced']:
+                os.fsync(_journal['file'].fileno())
+                _journal['unsynced'] = 0
+
+def open_journal():
+    """Open the journal for appending, holding JOURNAL_LOCK until close_journal() so replay can't move it meanwhile."""
+    global _journal
+    with _journal_lock:
+        if _journal is None:
+            lock = open(JOURNAL_LOCK, 'ab')
+            if not file_lock.try_lock(lock.fileno()):
+                lock.close()
+                raise OSError(f"{BILL_JOURNAL} is being replayed or written by another process; try again shortly")
+            _journal = {'file': open(BILL_JOURNAL, 'a', encoding='utf-8'), 'lock': lock, 'unsynced': 0}
+            threading.Thread(target=_journal_sync_loop, name='journal-sync', daemon=True).start()
+
+def append_journal(entry):
+    """
+    Append one completed cart. Entries are flushed immediately and fsynced in
+    groups of JOURNAL_FSYNC_EVERY, or within JOURNAL_FSYNC_SECONDS by the sync thread.
+    """
+    open_journal()
+    with _journal_lock:
+        f = _journal['file']
+        f.write(json.dumps(entry, default=str) + "\n")
+        f.flush()
+        _journal['unsynced'] += 1
+        if _journal['unsynced'] >= JOURNAL_FSYNC_EVERY:
+            os.fsync(f.fileno())
+            _journal['unsynced'] = 0
+
+def close_journal():
+    global _journal
+    with _journal_lock:
+        if _journal is not None:
+            _journal['file'].flush()
+            os.fsync(_journal['file'].fileno())
+            _journal['file'].close()
+            _journal['lock'].close()  # releases JOURNAL_LOCK
+            _journal = None
+
+atexit.register(close_journal)
+
+def offline_bill(catalog, current_user):
+    print("Making Bills (offline)")
+    try:
+        while True:
+            phone = input("Enter Phone no. of Customer: ").strip()
+            if len(phone) != 10 or not phone.isdigit():
+                print("Number should be exactly 10 digits.")
+            else:
+                break
+        name = input("Enter Name of Customer (Enter if returning): ").strip()
+        address = input("Enter Address of Customer (Enter if returning): ").strip()
+        lines = []
+        while True:
+            prod_id = input("Enter product ID (e=finalize): ").strip()
+            if prod_id.lower() in ('e', 'exit'):
+                break
+            if not prod_id.isdigit():
+                print("Search is unavailable offline; enter a product ID.")
+                continue
+            quantity = int(input("Enter quantity: ").strip())
+            if quantity <= 0:
+                print("Quantity must be > 0.")
+                continue
+            lines.append((int(prod_id), quantity))
+            print(f"Added {quantity} x product {prod_id}")
+
+        items, rejected = price_lines(catalog, lines)
+        for p_id, quantity, reason in rejected:
+            print(f"Skipped {quantity} x product {p_id}: {reason}")
+        if not items:
+            print("Nothing to bill.")
+            return
+        totals = cart_totals(items)
+        key = uuid.uuid4().hex
+        bill_date = date.today()
+        append_journal({
+            'key': key,
+            'created': t.strftime('%Y-%m-%d %H:%M:%S'),
+            'bill_date': bill_date.isoformat(),
+            'user_id': current_user['user_id'],
+            'phone': phone,
+            'name': name,
+            'address': address,
+            'items': items,
+        })
+        # the stock decrement is applied at replay; keep the local view honest meanwhile
+        for item in items:
+            name_, price, quantity, profit = catalog[item['p_id']]
+            catalog[item['p_id']] = (name_, price, (quantity or 0) - item['quantity'], profit)
+
+        invoice_no = f"OFF-{bill_date:%Y%m%d}-{key[:8]}"
+        receipt_items = [(item['p_id'], item['name'], item['quantity'], item['unit_price'],
+                          item['tax_rate'], item['line_total']) for item in items]
+        queue_receipt(invoice_no, render_receipt(
+            invoice_no, bill_date, name, phone, receipt_items, totals['total_price'], totals['gst']), bill_date)
+        print(f"Receipt queued to {RECEIPT_DIR}/")
+        print("\n--- Bill Summary (offline) ---")
+        print(f'Invoice No: {invoice_no}')
+        print(f"Total Before GST: {quantize_money(totals['subtotal'])}")
+        print(f"Applied GST: {totals['gst']}")
+        print(f"Total After GST: {totals['grand_total']}")
+        print(f'Bill Date: {bill_date}')
+    except ValueError as ve:
+        print(f"Invalid input: {ve}")
+    except OSError as e:
+        print(f"Error writing bill journal: {e}")
+
+def offline_login():
+    """Check a username and password against the saved offline credentials."""
+    users = load_offline_credentials()
+    if not users:
+        return None
+    print("Login Required (offline)")
+    for _ in range(3):
+        username = input("Username: ").strip()
+        password = input("Password: ").strip()
+        if username in users and verify_password(password, users[username][2]):
+            user_id, role, _ = users[username]
+            print(f"Logged in as {username} ({role})")
+            return {"user_id": user_id, "username": username, "role": role}
+        print("Invalid credentials.")
+    return None
+
+def offline_mode():
+    """Keep selling from the catalog snapshot while MySQL is unreachable."""
+    token = load_till_session()
+    current_user = verify_session_token(token) if token else None
+    if not current_user:
+        current_user = offline_login()
+    if not current_user:
+        print("Offline mode needs a till session or offline credentials from an earlier login. Exiting.")
+        return
+    try:
+        created, catalog = load_catalog_snapshot()
+    except (OSError, ValueError, KeyError) as e:
+        print(f"No usable catalog snapshot ({e}). Exiting.")
+        return
+    print(f"Database unreachable: OFFLINE MODE, prices from the catalog snapshot of {created}.")
+    print("Run 'python project_CS.py replay-journal' once the database is back.")
+    while True:
+        print("\nMain Menu (offline)")
+        print("1. Generate Bill")
+        print("e. Exit")
+        choice = input("Enter your choice: ").strip().lower()
+        if choice == '1':
+            offline_bill(catalog, current_user)
+        elif choice in ('e', 'exit'):
+            print("Exiting...")
+            close_journal()
+            stop_receipt_writer()
+            break
+        else:
+            print("Incorrect Command.")
+
+def read_journal(path):
+    """Journal entries in order; a torn last line from a crash is skipped."""
+    entries = []
+    with open(path, encoding='utf-8') as f:
+        for line_no, line in enumerate(f, start=1):
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"Journal line {line_no} is incomplete; skipped.")
+    return entries
+
+def apply_journal_batch(cursor, db_connection, batch, store_id=None):
+    """
+    Load one batch of journal entries into the database of store_id (None for
+    this till's store) in a single transaction; returns how many were new.
+    """
+    store_id = STORE_ID if store_id is None else store_id
+    placeholders = ', '.join(['%s'] * len(batch))
+    cursor.execute(f"SELECT idem_key FROM journal_applied WHERE idem_key IN ({placeholders})",
+                   tuple(entry['key'] for entry in batch))
+    done = {row[0] for row in cursor.fetchall()}
+    pending = [entry for entry in batch if entry['key'] not in done]
+    if not pending:
+        db_connection.rollback()
+        return 0
+
+    customers = {}
+    for entry in pending:
+        customers.setdefault(entry['phone'], (entry['phone'], entry['name'] or '', entry['address'] or ''))
+    placeholders = ', '.join(['%s'] * len(customers))
+    with home_checkout(db_connection, cursor, store_id) as (home_connection, home_cursor):
+        home_cursor.executemany("INSERT IGNORE INTO cust_info (phone_no, name, address) VALUES (%s, %s, %s)",
+                                list(customers.values()))
+        home_cursor.execute(f"SELECT cust_id, phone_no, name, address FROM cust_info WHERE phone_no IN ({placeholders})",
+                            tuple(customers))
+        records = home_cursor.fetchall()
+        if home_connection is not db_connection:
+            home_connection.commit()
+    if not is_home(store_id):
+        replicate_customers(cursor, records)
+    cust_ids = {phone: cust_id for cust_id, phone, _, _ in records}
+
+    # AUTO_INCREMENT numbers the bills, as it does for live tills, so a till
+    # billing during the replay never races it for a bill_no
+    bill_items = []
+    applied_rows = []
+    per_date = {}
+    for entry in pending:
+        items = [dict(item, unit_price=Decimal(item['unit_price']), tax_rate=Decimal(item['tax_rate']),
+                      line_total=Decimal(item['line_total']), profit=Decimal(item['profit']))
+                 for item in entry['items']]
+        cursor.execute("INSERT INTO bills (cust_id, bill_date, total_price) VALUES (%s, %s, %s)",
+                       (cust_ids[entry['phone']], entry['bill_date'], cart_totals(items)['total_price']))
+        bill_no = cursor.lastrowid
+        bill_items.extend((bill_no, item) for item in items)
+        applied_rows.append((entry['key'], bill_no))
+        day = per_date.setdefault(entry['bill_date'], [0, []])
+        day[0] += 1
+        day[1].extend(items)
+    insert_billitems(cursor, bill_items)
+    # goods already left the shop, so stock is floored at zero rather than rejected
+    decrement_stock(cursor, [item for _, item in bill_items], clamp=True)
+    for bill_date, (bills, items) in per_date.items():
+        record_sales_summary(cursor, bill_date, items, bills=bills)
+    cursor.executemany("INSERT INTO journal_applied (idem_key, bill_no) VALUES (%s, %s)", applied_rows)
+    db_connection.commit()
+    return len(pending)
+
+def replay_journal(cursor, db_connection, args):
+    """
+    Bulk-load offline bills into bills/billitems; safe to re-run thanks to
+    idempotency keys. Refuses while an offline till still has the journal open.
+    """
+    if not os.path.exists(BILL_JOURNAL):
+        print("No bill journal to replay.")
+        return
+    with open(JOURNAL_LOCK, 'ab') as lock:
+        if not file_lock.try_lock(lock.fileno()):
+            print("An offline till is still writing the bill journal. Exit its offline mode, then rerun.")
+            return
+        entries = read_journal(BILL_JOURNAL)
+        applied = 0
+        try:
+            for start in range(0, len(entries), JOURNAL_REPLAY_BATCH):
+                applied += apply_journal_batch(cursor, db_connection, entries[start:start + JOURNAL_REPLAY_BATCH],
+                                               args.store)
+        except sql.Error as e:
+            db_connection.rollback()
+            print(f"Replay stopped after {applied} bills: {e}. Fix the problem and rerun; applied bills are skipped.")
+            return
+        done_path = f"{BILL_JOURNAL}.replayed-{t.strftime('%Y%m%d_%H%M%S')}"
+        os.replace(BILL_JOURNAL, done_path)
+    print(f"Replayed {applied} offline bills ({len(entries) - applied} already applied). Journal moved to {done_path}.")
 
 # -------------------------
 # Admin menu and main
 # -------------------------
-def admin_privileges(cursor, db_connection, current_user):
+def admin_privileges(current_user):
     if not require_owner(current_user):
         return
+    # (operation, func, shard): customers and users live on the home database,
+    # everything else on this till's store (reports gather from every store)
+    actions = {
+        '4': ('check_stock', lambda cursor, db_connection: check_stock(cursor, **ask_stock_filters()), None),
+        '5': ('cust_info', lambda cursor, db_connection: cust_info(cursor), HOME),
+        '6': ('cust_update', cust_update, HOME),
+        '7': ('add_item', add_item, None),
+        '8': ('check_reorder', check_reorder, None),
+        '9': ('check_total_profits', lambda cursor, db_connection: check_total_profits(cursor), None),
+        '10': ('sales_reports', lambda cursor, db_connection: sales_reports(cursor), None),
+        '11': ('manage_users', manage_users, HOME),
+    }
     while True:
         print("\nAdmin Privileges (Owner)")
         print("4. Check Stock")
@@ -587,23 +2832,17 @@ def admin_privileges(cursor, db_connection, current_user):
         print("7. Insert New Product")
         print("8. Check Reorder Level")
         print("9. Check Total Profits")
+        print("10. Sales Reports")
         print("11. Manage Users (Add/Disable)")
         print("e. Exit Admin Privileges")
         choice = input("Enter your choice: ").strip()
-        if choice == '4':
-            check_stock(cursor)
-        elif choice == '5':
-            cust_info(cursor)
-        elif choice == '6':
-            cust_update(cursor, db_connection)
-        elif choice == '7':
-            add_item(cursor, db_connection)
-        elif choice == '8':
-            check_reorder(cursor, db_connection)
-        elif choice == '9':
-            check_total_profits(cursor)
-        elif choice == '11':
-            manage_users(cursor, db_connection)
+        if choice in actions:
+            try:
+                operation, action, shard = actions[choice]
+                with checkout(operation, shard=shard) as (db_connection, cursor):
+                    action(cursor, db_connection)
+            except sql.Error as e:
+                print(f"Database unavailable: {e}")
         elif choice.lower() in ('e','exit'):
             break
         else:
@@ -617,14 +2856,29 @@ def genrate():
 def main():
     db_connection, cursor = connect_to_database()
     if not db_connection or not cursor:
+        offline_mode()
+        return
+    if not migrate_shards(db_connection, cursor, [STORE_ID], use_cache=True):
+        db_connection.close()
         return
-    create_tables(cursor)
-    ensure_owner_user(cursor, db_connection)
-    current_user = login(cursor)
+    current_user = None
+    try:
+        current_user = resume_till_session(cursor)
+        if current_user:
+            print(f"Resumed session for {current_user['username']} ({current_user['role']})")
+        else:
+            ensure_owner_user(cursor, db_connection)
+            current_user = login(cursor)
+            if current_user:
+                save_till_session(create_session(cursor, db_connection, current_user))
+    except sql.Error as e:
+        print(f"Session error: {e}")
+    cursor.close()
+    db_connection.close()  # back to the pool; each menu action checks out its own
     if not current_user:
         print("Exiting due to failed login.")
-        db_connection.close()
         return
+    refresh_catalog_snapshot_async(current_user['user_id'])
     while True:
         print("\nMain Menu")
         print("1. Generate Bill")
@@ -633,16 +2887,74 @@ def main():
         print("e. Exit")
         choice = input("Enter your choice: ").strip().lower()
         if choice == '1':
-            bill(cursor, db_connection)
+            try:
+                with checkout('bill') as (db_connection, cursor):
+                    bill(cursor, db_connection)
+            except sql.Error as e:
+                print(f"Database unavailable: {e}")
         elif choice == '2' and current_user.get('role') == 'owner':
-            admin_privileges(cursor, db_connection, current_user)
+            admin_privileges(current_user)
         elif choice in ('e', 'exit'):
             genrate()
             print("Exiting...")
-            db_connection.close()
+            stop_receipt_writer()
+            logout(current_user)
+            export_metrics()
             break
         else:
             print("Incorrect Command.")
 
+# -------------------------
+# Maintenance commands
+# -------------------------
+# name -> (handler(cursor, db_connection, args), help, [(flags, argparse kwargs), ...])
+COMMANDS = {
+    'migrate': (migrate_command, "Apply pending schema migrations and show the schema version", []),
+    'snapshot-catalog': (snapshot_catalog_command, "Write the catalog snapshot used by offline tills", []),
+    'replay-journal': (replay_journal, "Load bills sold offline from the bill journal", []),
+    'backfill-summary': (backfill_sales_summary,
+                         "Rebuild sales_daily/sales_by_product and seed sales velocity from existing bills", []),
+    'set-lead-time': (set_lead_time, "Set a supplier's delivery lead time used for reorder thresholds", [
+        (('supplier',), {'help': "supplier name as stored in stock.supplier"}),
+        (('days',), {'type': int, 'help': "days from order to delivery"}),
+    ]),
+    'archive': (archive_bills, "Move old bills into the archive tables in small throttled batches", [
+        (('--days',), {'type': int, 'default': ARCHIVE_AFTER_DAYS, 'help': "archive bills older than this many days"}),
+        (('--batch',), {'type': int, 'default': ARCHIVE_BATCH, 'help': "bills per transaction"}),
+        (('--pause',), {'type': float, 'default': ARCHIVE_PAUSE, 'help': "seconds to wait between batches"}),
+    ]),
+    'reprint': (reprint_command, "Print a bill's receipt from the receipt store, or re-render it from the database", [
+        (('bill',), {'help': "bill number or invoice number (INV-YYYY-NNNNNN)"}),
+    ]),
+    'import-products': (import_products, "Bulk-load products from a CSV or JSONL file", [
+        (('file',), {'help': "CSV or JSONL file with name, price, quantity, brand, supplier, profit"}),
+        (('--chunk-size',), {'type': int, 'default': IMPORT_CHUNK_SIZE, 'help': "rows per transaction"}),
+        (('--resume',), {'action': 'store_true', 'help': "continue after the last committed chunk"}),
+    ]),
+}
+
+def run_command(argv):
+    parser = argparse.ArgumentParser(prog='project_CS.py')
+    parser.add_argument('--store', type=int, help=f"store to run the command against (default: STORE_ID, {STORE_ID})")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name, (_, help_text, arguments) in COMMANDS.items():
+        subparser = subparsers.add_parser(name, help=help_text)
+        for flags, kwargs in arguments:
+            subparser.add_argument(*flags, **kwargs)
+    args = parser.parse_args(argv)
+    handler = COMMANDS[args.command][0]
+    try:
+        with checkout(shard=HOME) as (db_connection, cursor):
+            stores = store_ids() if args.command == 'migrate' else [args.store or STORE_ID]
+            if not migrate_shards(db_connection, cursor, stores):
+                return
+        with checkout(args.command, shard=args.store) as (db_connection, cursor):
+            handler(cursor, db_connection, args)
+    except (sql.Error, ValueError) as e:
+        print(f"Error connecting to MySQL: {e}")
+
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1:
+        run_command(sys.argv[1:])
+    else:
+        main()
@@ -0,0 +1,300 @@
+import os
+import sys
+import zlib
+import time
+import struct
+import argparse
+import datetime
+import threading
+from collections import OrderedDict
+
+import file_lock
+
+# Receipts are appended to segment files instead of one .txt per invoice. A
+# writer holds a lock on the index beside its current segment (<YYYYMM>-<id>.seg,
+# .idx: one "invoice<TAB>date<TAB>offset<TAB>length" line per receipt), so tills
+# and the checkout service can share a directory. A restarted till reopens the
+# month's newest unlocked segment instead of starting another one. Each month
+# has its own segments; one rotates when it reaches SEGMENT_BYTES.
+RECEIPT_DIR = os.getenv('RECEIPT_DIR', 'receipts')
+SEGMENT_BYTES = int(os.getenv('RECEIPT_SEGMENT_BYTES', str(64 << 20)))
+SEGMENT_SUFFIX = '.seg'
+INDEX_SUFFIX = '.idx'
+RECORD_HEADER = struct.Struct('>I')  # compressed length
+# Segments open at once, one per month. A reprint or import of an older
+# month writes to that month's segment and leaves the live one alone.
+OPEN_SEGMENTS = 4
+# Receipts are short and nearly identical, so each one is deflated on its own
+# against a preset dictionary of the boilerplate: a reprint decompresses one
+# record, and the ratio stays close to compressing a whole segment. Segments
+# depend on these exact bytes; never edit them.
+ZDICT = (
+    "GROCERY SHOP RECEIPT\nInvoice: INV-\nDate: \nCustomer:   Phone: \n\nItems:\n"
+    "P_ID    Name                     Qty   Price     Tax%  Line      \n"
+    "18.00 .00     \n\nSubtotal (stored int): \nGST: \nGrand Total: \n"
+).encode('utf-8')
+
+def compress(text):
+    packer = zlib.compressobj(9, zdict=ZDICT)
+    return packer.compress(text.encode('utf-8')) + packer.flush()
+
+def decompress(data):
+    unpacker = zlib.decompressobj(zdict=ZDICT)
+    return (unpacker.decompress(data) + unpacker.flush()).decode('utf-8')
+
+def receipt_date(text):
+    """The bill date printed on a rendered receipt, or None."""
+    for line in text.splitlines():
+        if line.startswith('Date: '):
+            try:
+                return datetime.date.fromisoformat(line[len('Date: '):].strip()[:10])
+            except ValueError:
+                return None
+    return None
+
+class ReceiptStore:
+    """
+    Append-only receipt segments with an in-memory invoice -> (segment,
+    offset, length, date) map loaded from the .idx files, so a reprint is one
+    dictionary lookup and one read. A receipt is findable once its index line
+    is written; one lost in a crash can be re-rendered from the database.
+    """
+
+    def __init__(self, directory=RECEIPT_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._index = {}
+        self._index_read = {}  # .idx file -> bytes already loaded
+        self._open = OrderedDict()  # (year, month) -> (name, segment file, index file), least recent first
+
+    def _path(self, name, suffix):
+        return os.path.join(self.directory, name + suffix)
+
+    def _segment_for(self, day, size):
+        """The open segment for day's month with room for `size` more bytes, rotating if needed."""
+        month = (day.year, day.month)
+        current = self._open.get(month)
+        if current is not None and current[1].tell() + size <= SEGMENT_BYTES:
+            self._open.move_to_end(month)
+            return current
+        if current is not None:
+            self._close(month)
+        os.makedirs(self.directory, exist_ok=True)
+        prefix = f"{day:%Y%m}-"
+        reusable = sorted((file_name[:-len(SEGMENT_SUFFIX)] for file_name in os.listdir(self.directory)
+                           if file_name.startswith(prefix) and file_name.endswith(SEGMENT_SUFFIX)),
+                          reverse=True)
+        opened = None
+        for name in reusable:
+            if os.path.getsize(self._path(name, SEGMENT_SUFFIX)) + size <= SEGMENT_BYTES:
+                opened = self._open_segment(name)
+                if opened is not None:
+                    break
+        if opened is None:
+            # time in ms plus pid keeps names unique across writers and in creation order
+            name = f"{prefix}{int(time.time() * 1000):011x}-{os.getpid()}"
+            while os.path.exists(self._path(name, INDEX_SUFFIX)):
+                time.sleep(0.001)
+                name = f"{prefix}{int(time.time() * 1000):011x}-{os.getpid()}"
+            opened = self._open_segment(name)
+            if opened is None:
+                raise OSError(f"receipt segment {name} is locked by another process")
+        self._open[month] = opened
+        while len(self._open) > OPEN_SEGMENTS:
+            self._close(next(iter(self._open)))
+        return self._open[month]
+
+    def _open_segment(self, name):
+        """(name, segment file, index file) with the index locked, or None if another writer holds it."""
+        index_path = self._path(name, INDEX_SUFFIX)
+        index_file = open(index_path, 'a', encoding='utf-8')
+        if not file_lock.try_lock(index_file.fileno()):
+            index_file.close()
+            return None
+        # a writer that died mid-line left a torn last line; end it so ours start clean
+        with open(index_path, 'rb') as f:
+            torn = f.seek(0, os.SEEK_END) > 0 and f.seek(-1, os.SEEK_END) >= 0 and f.read(1) != b'\n'
+        if torn:
+            index_file.write('\n')
+        return (name, open(self._path(name, SEGMENT_SUFFIX), 'ab'), index_file)
+
+    def _close(self, month):
+        _, segment, index_file = self._open.pop(month)
+        segment.close()
+        index_file.flush()
+        file_lock.unlock(index_file.fileno())
+        index_file.close()
+
+    def append(self, invoice_no, text, day=None):
+        day = day or receipt_date(text) or datetime.date.today()
+        body = compress(text)
+        with self._lock:
+            name, segment, index_file = self._segment_for(day, RECORD_HEADER.size + len(body))
+            offset = segment.tell()
+            segment.write(RECORD_HEADER.pack(len(body)) + body)
+            segment.flush()
+            index_file.write(f"{invoice_no}\t{day.isoformat()}\t{offset}\t{len(body)}\n")
+            index_file.flush()
+            self._index[invoice_no] = (name, offset, len(body), day.isoformat())
+
+    def sync(self):
+        """fsync every open segment and index, so what was appended survives a power cut."""
+        with self._lock:
+            for _, segment, index_file in self._open.values():
+                os.fsync(segment.fileno())
+                os.fsync(index_file.fileno())
+            if self._open and hasattr(os, 'O_DIRECTORY'):  # new segment names live in the directory
+                fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+
+    def close(self):
+        with self._lock:
+            while self._open:
+                self._close(next(iter(self._open)))
+
+    def _refresh(self):
+        """Load index lines written since the last look, by this process or others."""
+        if not os.path.isdir(self.directory):
+            return
+        for file_name in sorted(os.listdir(self.directory)):
+            if not file_name.endswith(INDEX_SUFFIX):
+                continue
+            path = os.path.join(self.directory, file_name)
+            done = self._index_read.get(path, 0)
+            if os.path.getsize(path) <= done:
+                continue
+            segment = file_name[:-len(INDEX_SUFFIX)]
+            with open(path, 'rb') as f:
+                f.seek(done)
+                data = f.read()
+            complete = data.rfind(b'\n') + 1  # a writer may be mid-line
+            for line in data[:complete].decode('utf-8', 'replace').splitlines():
+                fields = line.split('\t')
+                if len(fields) != 4 or not fields[2].isdigit() or not fields[3].isdigit():
+                    continue  # torn line from a writer that died mid-append
+                invoice_no, day, offset, length = fields
+                self._index[invoice_no] = (segment, int(offset), int(length), day)
+            self._index_read[path] = done + complete
+
+    def lookup(self, invoice_no):
+        with self._lock:
+            if invoice_no not in self._index:
+                self._refresh()
+            return self._index.get(invoice_no)
+
+    def _read_record(self, segment, offset, length):
+        with open(self._path(segment, SEGMENT_SUFFIX), 'rb') as f:
+            f.seek(offset)
+            data = f.read(RECORD_HEADER.size + length)
+        if len(data) != RECORD_HEADER.size + length or RECORD_HEADER.unpack_from(data)[0] != length:
+            raise ValueError(f"receipt record at {segment}:{offset} is damaged")
+        return decompress(data[RECORD_HEADER.size:])
+
+    def read(self, invoice_no):
+        """The receipt text for an invoice number, or None."""
+        entry = self.lookup(invoice_no)
+        if entry is None:
+            return None
+        return self._read_record(*entry[:3])
+
+    def entries(self, start=None, end=None):
+        """(invoice_no, date) of every receipt dated start..end (inclusive), oldest first."""
+        with self._lock:
+            self._refresh()
+            first, last = str(start or datetime.date.min), str(end or datetime.date.max)
+            found = [(day, segment, offset, invoice_no) for invoice_no, (segment, offset, _, day)
+                     in self._index.items() if first <= day <= last]
+        return [(invoice_no, day) for day, _, _, invoice_no in sorted(found)]
+
+    def export(self, out, start=None, end=None):
+        """Write every receipt dated start..end to the text stream `out`; returns how many."""
+        count = 0
+        for invoice_no, _ in self.entries(start, end):
+            out.write(self.read(invoice_no))
+            out.write("\f\n")  # form feed between receipts, one per page when printed
+            count += 1
+        return count
+
+    def import_text_files(self, directory=None, remove=False):
+        """Append the old one-file-per-receipt INV-*.txt files; already-stored invoices are skipped."""
+        directory = directory or self.directory
+        imported = skipped = 0
+        stored = []
+        for file_name in sorted(os.listdir(directory)):
+            if not file_name.endswith('.txt'):
+                continue
+            path = os.path.join(directory, file_name)
+            invoice_no = file_name[:-len('.txt')]
+            if self.lookup(invoice_no) is None:
+                with open(path, encoding='utf-8') as f:
+                    text = f.read()
+                day = receipt_date(text) or datetime.date.fromtimestamp(os.path.getmtime(path))
+                self.append(invoice_no, text, day)
+                imported += 1
+            else:
+                skipped += 1
+            stored.append(path)
+        if remove:
+            self.sync()  # the segments must be on disk before the only other copy goes
+            for path in stored:
+                os.remove(path)
+        return imported, skipped
+
+    def stats(self):
+        with self._lock:
+            self._refresh()
+            segments = sorted({segment for segment, _, _, _ in self._index.values()})
+        size = sum(os.path.getsize(self._path(segment, SEGMENT_SUFFIX)) for segment in segments)
+        return {'receipts': len(self._index), 'segments': len(segments), 'bytes': size}
+
+def parse_date(text):
+    return datetime.date.fromisoformat(text)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Read, export and import receipts in the segmented receipt store.')
+    parser.add_argument('--dir', default=RECEIPT_DIR, help=f'receipt directory (default: {RECEIPT_DIR})')
+    sub = parser.add_subparsers(dest='command', required=True)
+    show_parser = sub.add_parser('show', help='print one receipt')
+    show_parser.add_argument('invoice', help='invoice number, e.g. INV-2025-000123')
+    export_parser = sub.add_parser('export', help='write every receipt in a date range to one text file')
+    export_parser.add_argument('--from', dest='start', type=parse_date, help='first date (YYYY-MM-DD)')
+    export_parser.add_argument('--to', dest='end', type=parse_date, help='last date (YYYY-MM-DD)')
+    export_parser.add_argument('--out', help='output file (default: stdout)')
+    import_parser = sub.add_parser('import', help='copy old per-invoice .txt receipts into segments')
+    import_parser.add_argument('--source', help='directory holding the .txt files (default: --dir)')
+    import_parser.add_argument('--delete', action='store_true', help='remove the .txt files once stored')
+    sub.add_parser('stats', help='receipt, segment and byte counts')
+    args = parser.parse_args(argv)
+    store = ReceiptStore(args.dir)
+
+    try:
+        if args.command == 'show':
+            text = store.read(args.invoice)
+            if text is None:
+                print(f"No receipt {args.invoice} in {args.dir}/")
+                sys.exit(1)
+            print(text, end='')
+        elif args.command == 'export':
+            if args.out:
+                with open(args.out, 'w', encoding='utf-8') as out:
+                    count = store.export(out, args.start, args.end)
+                print(f"Exported {count} receipts to {args.out}")
+            else:
+                store.export(sys.stdout, args.start, args.end)
+        elif args.command == 'import':
+            imported, skipped = store.import_text_files(args.source, remove=args.delete)
+            print(f"Imported {imported} receipts ({skipped} already stored) into {args.dir}/")
+        else:
+            stats = store.stats()
+            print(f"{stats['receipts']} receipts in {stats['segments']} segments, {stats['bytes']} bytes")
+    except (OSError, ValueError) as e:
+        print(f"Receipt store error: {e}")
+        sys.exit(1)
+    finally:
+        store.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+import io
+import os
+import re
+import sys
+import json
+import gzip
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import mysql.connector as sql
+from backup import BACKUP_DIR, ARCHIVE_TABLES, backup_runs, db_settings
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Tables in each level only reference tables in earlier levels, so a level can
+# load in parallel once the previous one is done. Unknown tables go last.
+LOAD_LEVELS = [
+    ('stock', 'cust_info', 'users', 'sales_daily'),
+    ('profits', 'bills', 'sessions', 'sales_by_product'),
+    ('billitems',),
+]
+COMMIT_EVERY = 200  # statements per commit; each mysqldump INSERT carries many rows
+DEFERRED_LINE = re.compile(r'^\s*((UNIQUE |FULLTEXT )?KEY |CONSTRAINT .* FOREIGN KEY )')
+UNIQUE_KEY = re.compile(r'^UNIQUE KEY (`[^`]+`) \((.+)\)$')
+
+def open_dump(path):
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError("the zstandard package is needed to read .zst backups")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True),
+                                encoding='utf-8')
+    return gzip.open(path, 'rt', encoding='utf-8')
+
+def read_statements(path):
+    """Yield SQL statements from a mysqldump file (one statement ends at a line ending in ';')."""
+    buf = []
+    with open_dump(path) as f:
+        for line in f:
+            if not buf and (line.startswith('--') or not line.strip()):
+                continue
+            buf.append(line)
+            if line.rstrip().endswith(';'):
+                yield ''.join(buf).strip().rstrip(';')
+                buf = []
+
+def split_create_table(statement):
+    """
+    Strip secondary keys and foreign keys out of a CREATE TABLE so rows load
+    into the bare clustered index; returns (create_statement, deferred definitions).
+    """
+    kept = []
+    deferred = []
+    for line in statement.splitlines():
+        if DEFERRED_LINE.match(line):
+            deferred.append(line.strip().rstrip(','))
+        else:
+            kept.append(line)
+    # the line before the closing ')' may now carry a dangling comma
+    for i in range(len(kept) - 1, 0, -1):
+        if kept[i].lstrip().startswith(')'):
+            kept[i - 1] = kept[i - 1].rstrip().rstrip(',')
+            break
+    return '\n'.join(kept), deferred
+
+def connect(settings):
+    conn = sql.connect(**settings, autocommit=False)
+    cur = conn.cursor()
+    cur.execute("SET foreign_key_checks = 0")
+    cur.execute("SET unique_checks = 0")
+    return conn, cur
+
+def load_file(settings, table, path, deferred):
+    """Replay one table dump; returns (table, rows, seconds)."""
+    started = time.monotonic()
+    conn, cur = connect(settings)
+    rows = 0
+    pending = 0
+    try:
+        for statement in read_statements(path):
+            if statement.startswith('CREATE TABLE'):
+                statement, deferred[table] = split_create_table(statement)
+            cur.execute(statement)
+            if statement.startswith('INSERT'):
+                rows += statement.count('),(') + 1  # approximate: extended INSERT row count
+                pending += 1
+                if pending >= COMMIT_EVERY:
+                    conn.commit()
+                    pending = 0
+        conn.commit()
+    finally:
+        conn.close()
+    return table, rows, time.monotonic() - started
+
+def check_unique(cur, table, definition):
+    """
+    The definition to add for a deferred key: a UNIQUE key whose columns hold
+    duplicates (edits that no incremental captured) is built as a plain KEY,
+    so the restore still finishes; the duplicates are reported for fixing.
+    """
+    match = UNIQUE_KEY.match(definition)
+    if not match:
+        return definition, None
+    name, columns = match.groups()
+    cur.execute(f"SELECT {columns}, COUNT(*) FROM `{table}` GROUP BY {columns} HAVING COUNT(*) > 1 LIMIT 5")
+    duplicates = cur.fetchall()
+    if not duplicates:
+        return definition, None
+    sample = ', '.join(str(row[:-1] if len(row) > 2 else row[0]) for row in duplicates)
+    return f"KEY {name} ({columns})", f"{table}.{name} is not unique ({sample}); built as a plain index"
+
+def build_deferred(settings, table, definitions):
+    """
+    Add the keys, then the foreign keys, stripped from one table's CREATE
+    TABLE; returns (table, problems).
+    """
+    conn, cur = connect(settings)
+    problems = []
+    try:
+        keys = []
+        for definition in definitions:
+            if 'FOREIGN KEY' not in definition:
+                definition, problem = check_unique(cur, table, definition)
+                keys.append(definition)
+                if problem:
+                    problems.append(problem)
+        foreign = [d for d in definitions if 'FOREIGN KEY' in d]
+        for group in (keys, foreign):
+            if group:
+                cur.execute(f"ALTER TABLE `{table}` " + ', '.join(f"ADD {d}" for d in group))
+    finally:
+        conn.close()
+    return table, problems
+
+def drop_archived_live_rows(settings):
+    """
+    A bill captured live by one segment and archived before a later one ends
+    up in both places; the archive copy is the current one.
+    """
+    conn, cur = connect(settings)
+    try:
+        cur.execute(f"DELETE bi FROM billitems bi INNER JOIN {ARCHIVE_TABLES[1]} a ON a.id = bi.id")
+        cur.execute(f"DELETE b FROM bills b INNER JOIN {ARCHIVE_TABLES[0]} a ON a.bill_no = b.bill_no")
+        conn.commit()
+    finally:
+        conn.close()
+
+def restore_chain(backup_dir):
+    """The full backup in backup_dir followed by every incremental built on it, oldest first."""
+    with open(os.path.join(backup_dir, 'manifest.json'), encoding='utf-8') as f:
+        full = json.load(f)
+    if full['mode'] != 'full':
+        raise RuntimeError(f"{backup_dir} is an incremental backup; point restore at a full one")
+    chain = [(backup_dir, full)]
+    for directory, manifest in backup_runs(os.path.dirname(os.path.abspath(backup_dir)), full['database']):
+        if manifest['mode'] == 'incremental' and manifest['base'] == chain[-1][1]['created']:
+            chain.append((directory, manifest))
+    return chain
+
+def load_levels(settings, directory, manifest, deferred, jobs, totals):
+    tables = list(manifest['tables'])
+    known = [name for level in LOAD_LEVELS for name in level]
+    levels = [[name for name in level if name in tables] for level in LOAD_LEVELS]
+    levels.append([name for name in tables if name not in known])
+    for level in levels:
+        if not level:
+            continue
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+            futures = [pool.submit(load_file, settings, table,
+                                   os.path.join(directory, manifest['tables'][table]['file']), deferred)
+                       for table in level]
+            for future in futures:
+                table, rows, seconds = future.result()
+                totals['rows'] += rows
+                print(f"  {table}: {rows} rows in {seconds:.1f}s ({rows / max(seconds, 1e-6):.0f} rows/s)")
+
+def run_restore(backup_dir, jobs=4, full_only=False):
+    settings = db_settings()
+    chain = restore_chain(backup_dir)
+    if full_only:
+        chain = chain[:1]
+    started = time.monotonic()
+    totals = {'rows': 0}
+    deferred = {}
+    for directory, manifest in chain:
+        print(f"Loading {manifest['mode']} backup {manifest['created']}...")
+        load_levels(settings, directory, manifest, deferred, jobs, totals)
+    if len(chain) > 1 and ARCHIVE_TABLES[0] in chain[-1][1]['tables']:
+        drop_archived_live_rows(settings)
+    print("Building deferred indexes and foreign keys...")
+    problems = []
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        for table, table_problems in pool.map(lambda item: build_deferred(settings, *item), deferred.items()):
+            print(f"  {table}: done")
+            problems.extend(table_problems)
+    for problem in problems:
+        print(f"Warning: {problem}")
+    seconds = time.monotonic() - started
+    # incrementals taken before they carried SNAPSHOT_TABLES leave stock and
+    # the summaries at the full backup's state
+    if any(manifest['mode'] == 'incremental' and 'sales_daily' not in manifest['tables']
+           for _, manifest in chain[1:]):
+        print("Older incremental segments lack stock and sales summaries: run "
+              "'python project_CS.py backfill-summary' and check stock levels.")
+    return {'segments': len(chain), 'rows': totals['rows'], 'seconds': round(seconds, 3),
+            'rows_per_sec': round(totals['rows'] / max(seconds, 1e-6))}
+
+def newest_full_backup(db_name):
+    for directory, manifest in reversed(backup_runs(BACKUP_DIR, db_name)):
+        if manifest['mode'] == 'full':
+            return directory
+    raise RuntimeError(f"no full backup of {db_name} found in {BACKUP_DIR}/")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Restore the grocery database from backup.py output.')
+    parser.add_argument('backup', nargs='?',
+                        help=f'full backup directory (default: newest full backup in {BACKUP_DIR}/)')
+    parser.add_argument('--jobs', type=int, default=4, help='tables loaded in parallel')
+    parser.add_argument('--full-only', action='store_true', help='skip incremental segments')
+    args = parser.parse_args(argv)
+    backup_dir = args.backup
+    try:
+        if backup_dir is None:
+            backup_dir = newest_full_backup(db_settings()['database'])
+        stats = run_restore(backup_dir, args.jobs, args.full_only)
+        print(f"Restored {stats['rows']} rows from {stats['segments']} segment(s) in "
+              f"{stats['seconds']}s ({stats['rows_per_sec']} rows/s)")
+    except Exception as e:
+        print(f'Restore failed: {e}')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()